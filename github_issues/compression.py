@@ -0,0 +1,65 @@
+"""
+Transparent compression for issue datasets, chosen by file extension: paths
+ending in `.gz` are gzip and paths ending in `.zst` are Zstandard, e.g.
+`issues.csv.gz`. Anything else is opened as a plain file.
+
+Files opened for appending get a new gzip member or zstd frame, and readers
+read across all of them, so appending to a compressed CSV works like
+appending to a plain one.
+"""
+
+import gzip
+import io
+from typing import BinaryIO, Optional, TextIO
+
+
+def compression_for(path: str) -> Optional[str]:
+    path = path.lower()
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def import_zstandard():
+    # Optional dependency, only needed for .zst files
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "Reading or writing .zst files needs the zstandard package: "
+            "pip install zstandard"
+        ) from None
+    return zstandard
+
+
+def open_binary(path: str, mode: str = "rb", like: Optional[str] = None) -> BinaryIO:
+    """
+    `like` picks the compression from another path, e.g. for the temporary
+    file an output is written to before being moved into place.
+    """
+    compression = compression_for(like or path)
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        zstandard = import_zstandard()
+        if "r" in mode:
+            return zstandard.ZstdDecompressor().stream_reader(
+                open(path, "rb"), read_across_frames=True
+            )
+        return zstandard.ZstdCompressor().stream_writer(open(path, mode))
+    return open(path, mode)
+
+
+def open_text(
+    path: str,
+    mode: str = "r",
+    encoding: str = "utf8",
+    newline: Optional[str] = None,
+    like: Optional[str] = None,
+) -> TextIO:
+    if compression_for(like or path) is None:
+        return open(path, mode, encoding=encoding, newline=newline)
+    binary = open_binary(path, mode.replace("t", "") + "b", like)
+    return io.TextIOWrapper(binary, encoding=encoding, newline=newline)
@@ -4,13 +4,22 @@ Script to filter GitHub issues based on tags, showing only help-wanted issues.
 Author: GPT-4
 
 Usage:
-  python get_help_wanted.py <input.csv> --output <output.csv> [--good-first-issue] [--accepting-prs]
+  python get_help_wanted.py <input.csv> --output <output.csv> [--good-first-issue] [--accepting-prs] [--workers <n>]
 """
 
 import argparse
+import collections
 import csv
+import functools
+import io
+import itertools
+import re
 import sys
-from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, List, Dict, Tuple
+
+from compression import open_binary, open_text
+from issue_store import COLUMNS, IssueStore, is_store
 
 # Increase CSV field size limit
 maxInt = sys.maxsize
@@ -120,45 +129,224 @@ NOT_OPEN_LABELS = list(
 )
 
 
+# Compiled forms of the lists above. Substring rules only look for letters, so
+# they can run once over the whole lowercased Labels value.
+NOT_OPEN_SET = frozenset(NOT_OPEN_LABELS)
+GOOD_FIRST_ISSUE_SET = frozenset(GOOD_FIRST_ISSUE_LABELS)
+ACCEPTING_PRS_SET = frozenset(ACCEPTING_PRS_LABELS)
+NOT_OPEN_PATTERN = re.compile("waiting|blocked|linear|discuss")
+GOOD_FIRST_ISSUE_PATTERN = re.compile("easy|beginner")
+ACCEPTING_PRS_PATTERN = re.compile("help|accepting|contrib")
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def classify_labels(labels: str) -> Tuple[bool, bool, bool]:
+    """
+    Returns whether a raw `Labels` value marks an issue as not open, as a good
+    first issue, and as accepting PRs. Cached, since label sets repeat a lot.
+    """
+    labels = labels.lower()
+    # Every label also matches with spaces and dashes swapped
+    variants = set()
+    for label in labels.split(", "):
+        variants.add(label)
+        variants.add(label.replace(" ", "-"))
+        variants.add(label.replace("-", " "))
+    not_open = not variants.isdisjoint(NOT_OPEN_SET) or bool(
+        NOT_OPEN_PATTERN.search(labels)
+    )
+    good_first_issue = not variants.isdisjoint(GOOD_FIRST_ISSUE_SET) or bool(
+        GOOD_FIRST_ISSUE_PATTERN.search(labels)
+    )
+    accepting_prs = not variants.isdisjoint(ACCEPTING_PRS_SET) or bool(
+        ACCEPTING_PRS_PATTERN.search(labels)
+    )
+    return not_open, good_first_issue, accepting_prs
+
+
 def issue_filter(
     issue: Dict[str, str], good_first_issues: bool, accepting_prs: bool
 ) -> bool:
-    labels = issue["Labels"].lower().split(", ")
-    labels += list(map(lambda x: x.replace(" ", "-"), labels))
-    labels += list(map(lambda x: x.replace("-", " "), labels))
+    not_open, good_first_issue, accepting = classify_labels(issue["Labels"])
     # Always filter out NOT_OPEN_LABELS
-    if any(label in NOT_OPEN_LABELS for label in labels):
-        return False
-    if any(
-        "waiting" in label
-        or "blocked" in label
-        or "linear" in label
-        or "discuss" in label
-        for label in labels
-    ):
+    if not_open:
         return False
-    if (good_first_issues or accepting_prs) and any(
-        "easy" in label or "beginner" in label for label in labels
-    ):
-        return True
-    if (good_first_issues or accepting_prs) and any(
-        label in GOOD_FIRST_ISSUE_LABELS for label in labels
-    ):
+    if (good_first_issues or accepting_prs) and good_first_issue:
         return True
     if good_first_issues:
         return False
-    if accepting_prs and any(
-        "help" in label or "accepting" in label or "contrib" in label
-        for label in labels
-    ):
-        return True
-    if accepting_prs and any(label in ACCEPTING_PRS_LABELS for label in labels):
-        return True
     if accepting_prs:
-        return False
+        return accepting
     return True
 
 
+def filter_issues(
+    issues: Iterable[Dict[str, str]], good_first_issues: bool, accepting_prs: bool
+) -> Iterator[Dict[str, str]]:
+    """
+    Filter stage over rows from a CSV reader or straight from the API, see
+    pull_github_issues.py --help-wanted.
+    """
+    for issue in issues:
+        if issue_filter(issue, good_first_issues, accepting_prs):
+            yield issue
+
+
+def read_wanted(
+    path: str, encoding: str, good_first_issues: bool, accepting_prs: bool
+) -> Iterator[Dict[str, str]]:
+    # For an issue store the filter runs inside the query
+    if is_store(path):
+        with IssueStore(path) as store:
+            store.db.create_function(
+                "wanted",
+                1,
+                lambda labels: issue_filter(
+                    {"Labels": labels}, good_first_issues, accepting_prs
+                ),
+                deterministic=True,
+            )
+            yield from store.rows("wanted(labels)")
+    else:
+        with open_text(path, "r", encoding=encoding) as f_in:
+            yield from filter_issues(
+                csv.DictReader(f_in), good_first_issues, accepting_prs
+            )
+
+
+def filter_store(args) -> None:
+    """
+    Filter when the input or the output is an issue store. Like a CSV output,
+    an output store is replaced.
+    """
+    issues = read_wanted(
+        args.input, args.encoding, args.good_first_issue, args.accepting_prs
+    )
+    if is_store(args.output):
+        with IssueStore(args.output) as store:
+            store.clear()
+            store.upsert(issues)
+    else:
+        with open_text(args.output, "w", newline="", encoding = args.encoding) as f_out:
+            writer = csv.DictWriter(f_out, fieldnames=list(COLUMNS))
+            writer.writeheader()
+            writer.writerows(issues)
+
+
+# Input is handed to worker processes in chunks of about this many bytes
+CHUNK_SIZE = 4 << 20
+
+
+def quoted_parity(data: bytes, start: int, end: int) -> int:
+    return data.count(b'"', start, end) % 2
+
+
+def first_record_boundary(data: bytes) -> int:
+    """
+    Offset just past the first newline in `data` that ends a CSV record. A
+    newline ends a record iff an even number of quote characters precede it,
+    since escaped quotes come in pairs.
+    """
+    parity = 0
+    start = 0
+    newline = data.find(b"\n")
+    while newline != -1:
+        parity ^= quoted_parity(data, start, newline)
+        if parity == 0:
+            return newline + 1
+        start = newline
+        newline = data.find(b"\n", newline + 1)
+    return len(data)
+
+
+def last_record_boundary(data: bytes) -> int:
+    """
+    Offset just past the last newline in `data` that ends a CSV record, or 0.
+    """
+    parity = quoted_parity(data, 0, len(data))
+    end = len(data)
+    newline = data.rfind(b"\n")
+    while newline != -1:
+        parity ^= quoted_parity(data, newline, end)
+        if parity == 0:
+            return newline + 1
+        end = newline
+        newline = data.rfind(b"\n", 0, newline)
+    return 0
+
+
+def iter_chunks(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Split a CSV file into chunks of whole records. Only works for encodings
+    where newlines and quotes are single ASCII bytes, like UTF-8.
+    """
+    pending = b""
+    for block in iter(lambda: file.read(chunk_size), b""):
+        pending += block
+        split = last_record_boundary(pending)
+        if split:
+            yield pending[:split]
+            pending = pending[split:]
+    if pending:
+        yield pending
+
+
+def filter_chunk(
+    chunk: bytes,
+    fieldnames: List[str],
+    encoding: str,
+    good_first_issues: bool,
+    accepting_prs: bool,
+) -> str:
+    # Same newline translation as reading the file in text mode
+    text = chunk.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=fieldnames)
+    reader = csv.DictReader(io.StringIO(text), fieldnames=fieldnames)
+    writer.writerows(filter_issues(reader, good_first_issues, accepting_prs))
+    return out.getvalue()
+
+
+def filter_parallel(args) -> None:
+    with (open_binary(args.input, "rb") as f_in,
+          open_text(args.output, "w", newline="", encoding = args.encoding) as f_out,
+          ProcessPoolExecutor(max_workers=args.workers) as executor):
+        chunks = iter_chunks(f_in)
+        first = next(chunks, b"")
+        header_end = first_record_boundary(first)
+        header = first[:header_end].decode(args.encoding)
+        fieldnames = next(csv.reader(io.StringIO(header)), None)
+        if fieldnames is None:
+            return
+        writer = csv.DictWriter(f_out, fieldnames=fieldnames)
+        writer.writeheader()
+
+        # Results are written in input order, with a bounded number in flight
+        pending = collections.deque()
+        for chunk in itertools.chain([first[header_end:]], chunks):
+            pending.append(
+                executor.submit(
+                    filter_chunk,
+                    chunk,
+                    fieldnames,
+                    args.encoding,
+                    args.good_first_issue,
+                    args.accepting_prs,
+                )
+            )
+            if len(pending) >= 2 * args.workers:
+                f_out.write(pending.popleft().result())
+        while pending:
+            f_out.write(pending.popleft().result())
+
+
+def is_ascii_compatible(encoding: str) -> bool:
+    try:
+        return "\n\"".encode(encoding) == b'\n"'
+    except LookupError:
+        return False
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("input", type=str, help="Input CSV file")
@@ -172,16 +360,35 @@ def main():
     parser.add_argument(
         "--encoding", type=str, default = "utf8", help="The encoding of the CSV file"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to filter the input with (ASCII-compatible encodings only)",
+    )
     args = parser.parse_args()
+    if args.workers > 1 and (is_store(args.input) or is_store(args.output)):
+        parser.error("--workers only works with CSV files")
+    # Chunks are split on raw newline and quote bytes before decoding
+    if args.workers > 1 and not is_ascii_compatible(args.encoding):
+        parser.error(f"--workers doesn't work with {args.encoding} input")
+
+    if is_store(args.input) or is_store(args.output):
+        filter_store(args)
+        return
+
+    if args.workers > 1:
+        filter_parallel(args)
+        return
 
-    with (open(args.input, "r", encoding = args.encoding) as f_in, 
-          open(args.output, "w", newline="", encoding = args.encoding) as f_out):
+    with (open_text(args.input, "r", encoding = args.encoding) as f_in, 
+          open_text(args.output, "w", newline="", encoding = args.encoding) as f_out):
         reader = csv.DictReader(f_in)
         writer = csv.DictWriter(f_out, fieldnames=reader.fieldnames)
         writer.writeheader()
-        for issue in reader:
-            if issue_filter(issue, args.good_first_issue, args.accepting_prs):
-                writer.writerow(issue)
+        writer.writerows(
+            filter_issues(reader, args.good_first_issue, args.accepting_prs)
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+"""
+GitHub API client shared by the scripts in this directory.
+
+All requests go through one keep-alive `requests.Session` with a connection
+pool, negotiate gzip, draw from the rate limit budgets of
+`rate_limit.RateLimitScheduler`, and are retried with jittered exponential
+backoff on 5xx responses and connection errors.
+"""
+
+import logging
+import os
+import random
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from http_cache import ResponseCache, cached_get
+from rate_limit import RateLimitScheduler
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Can point at a local stub server for testing
+API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+# Pages of starred repos listed at the same time
+LISTING_WORKERS = 8
+
+
+def get_next_page_link(link_header: str) -> Optional[str]:
+    if link_header:
+        links = link_header.split(", ")
+        for link in links:
+            url, rel = link.split("; ")
+            if rel == 'rel="next"':
+                return url.strip("<>")
+    return None
+
+
+def get_last_page(link_header: str) -> int:
+    if link_header:
+        for link in link_header.split(", "):
+            url, rel = link.split("; ")
+            if rel == 'rel="last"':
+                return int(parse_qs(urlparse(url.strip("<>")).query)["page"][0])
+    return 1
+
+
+class StarredRepo(NamedTuple):
+    full_name: str
+    open_issues_count: int
+    has_issues: bool
+    archived: bool
+    pushed_at: Optional[str]
+    updated_at: Optional[str]
+
+
+class GitHubClient:
+    """
+    `tokens[0]` is used for endpoints that depend on who is asking, such as
+    /user/starred; other requests are spread over all tokens.
+    """
+
+    def __init__(
+        self,
+        tokens: List[str],
+        cache: Optional[ResponseCache] = None,
+        pool_size: int = 64,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+    ):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {"Accept": "application/vnd.github+json", "Accept-Encoding": "gzip, deflate"}
+        )
+        self.scheduler = RateLimitScheduler(tokens, session=self.session)
+        self.user_headers = {"Authorization": f"token {tokens[0]}"} if tokens else {}
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Approximate under concurrency; only used for budgeting
+        self.requests_sent = 0
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            self.requests_sent += 1
+            try:
+                response = self.scheduler.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"{method} {url} failed: {str(e)}")
+            else:
+                if response.status_code < 500 or attempt == self.max_retries:
+                    return response
+                logging.warning(f"{method} {url} returned {response.status_code}")
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            time.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+    def get(
+        self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None
+    ) -> requests.Response:
+        return cached_get(
+            self.cache,
+            url,
+            headers or {},
+            params,
+            send=lambda url, **kwargs: self.request("GET", url, **kwargs),
+        )
+
+    def paginate(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        key: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """
+        Yield the items of every page, following `rel="next"` links lazily.
+
+        `key` selects the list inside object responses, e.g. "items" for search.
+        """
+        while url:
+            response = self.get(url, params, headers)
+            response.raise_for_status()
+            page = response.json()
+            yield from page[key] if key else page
+            url = get_next_page_link(response.headers.get("Link", ""))
+            # The next link already carries the query string
+            params = None
+
+    def get_starred_page(self, page: int) -> Tuple[List[StarredRepo], str]:
+        response = self.get(
+            f"{API_URL}/user/starred", {"per_page": 100, "page": page}, self.user_headers
+        )
+        response.raise_for_status()
+        repos = [
+            StarredRepo(
+                repo["full_name"],
+                repo["open_issues_count"],
+                repo["has_issues"],
+                repo["archived"],
+                repo["pushed_at"],
+                repo["updated_at"],
+            )
+            for repo in response.json()
+        ]
+        return repos, response.headers.get("Link", "")
+
+    def starred_repo_pages(self, executor: Executor) -> List["Future[List[StarredRepo]]"]:
+        """
+        Fetch the first page of starred repos, then all the others concurrently
+        using the page count from its `rel="last"` link.
+
+        Returns one future per page, in starred order.
+        """
+        first_page, link_header = self.get_starred_page(1)
+        first = Future()
+        first.set_result(first_page)
+        return [first] + [
+            executor.submit(lambda page: self.get_starred_page(page)[0], page)
+            for page in range(2, get_last_page(link_header) + 1)
+        ]
+
+    def get_starred_repos(self) -> List[StarredRepo]:
+        with ThreadPoolExecutor(max_workers=LISTING_WORKERS) as executor:
+            return [
+                repo
+                for page in self.starred_repo_pages(executor)
+                for repo in page.result()
+            ]
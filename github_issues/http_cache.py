@@ -0,0 +1,145 @@
+"""
+Persistent on-disk cache for GitHub API responses.
+
+Cached responses are revalidated with `If-None-Match` / `If-Modified-Since`, so
+an unchanged page costs a 304, which GitHub does not count against the rate
+limit, and its body is served from disk.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "contributor-tools", "http"
+)
+
+# Response headers that are still meaningful when a body is replayed from disk
+CACHED_HEADERS = ["Content-Type", "ETag", "Last-Modified", "Link"]
+
+
+class ResponseCache:
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = 256 << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(
+            entry.stat().st_size
+            for entry in os.scandir(directory)
+            if entry.name.endswith(".json")
+        )
+
+    def key(self, url: str, headers: Dict[str, str], params: Optional[dict]) -> str:
+        # Key on the fully expanded URL and the credentials, since endpoints like
+        # /user/starred answer differently for different tokens
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        auth = headers.get("Authorization", "")
+        return hashlib.sha256(f"{auth}\n{full_url}".encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.path(key), "r", encoding="utf8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Mark as recently used for eviction
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        return entry
+
+    def store(self, key: str, response: requests.Response) -> None:
+        entry = {
+            "headers": {
+                name: response.headers[name]
+                for name in CACHED_HEADERS
+                if name in response.headers
+            },
+            "content": response.text,
+        }
+        data = json.dumps(entry).encode("utf8")
+        path = self.path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self.lock:
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        # Drop least recently used entries until we are comfortably under budget
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+
+
+def replay(entry: dict, not_modified: requests.Response) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = not_modified.url
+    response.request = not_modified.request
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    # Fresh rate limit headers etc. come from the 304 itself
+    for name, value in not_modified.headers.items():
+        if name.lower() not in ("content-length", "content-encoding", "transfer-encoding"):
+            response.headers[name] = value
+    response.encoding = "utf-8"
+    response._content = entry["content"].encode("utf-8")
+    response.from_cache = True
+    return response
+
+
+def cached_get(
+    cache: Optional[ResponseCache],
+    url: str,
+    headers: Dict[str, str],
+    params: Optional[dict] = None,
+    send: Callable[..., requests.Response] = requests.get,
+) -> requests.Response:
+    if cache is None:
+        return send(url, headers=headers, params=params)
+
+    key = cache.key(url, headers, params)
+    entry = cache.load(key)
+    request_headers = dict(headers)
+    if entry:
+        if "ETag" in entry["headers"]:
+            request_headers["If-None-Match"] = entry["headers"]["ETag"]
+        if "Last-Modified" in entry["headers"]:
+            request_headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+    response = send(url, headers=request_headers, params=params)
+    if response.status_code == 304 and entry:
+        return replay(entry, response)
+    if response.status_code == 200 and (
+        "ETag" in response.headers or "Last-Modified" in response.headers
+    ):
+        cache.store(key, response)
+    return response
@@ -0,0 +1,121 @@
+"""
+Compact in-memory issue dataset for serve_github_issues.py.
+
+Issues are stored column by column: timestamps, comments and reactions in
+integer arrays, repositories and labels as interned strings shared between
+issues. Sort orders are arrays of row indexes, built the first time they are
+asked for. Rows are only turned back into dicts with human-readable dates
+when they are rendered.
+"""
+
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Tuple
+
+DATE_FORMAT = "%b %d, %Y %H:%M:%S"
+
+# Sort name -> (column, descending)
+SORTS = {
+    "created_at": ("created_at", True),
+    "updated_at": ("updated_at", True),
+    "total_reactions": ("reactions", True),
+    "repo_name": ("repositories", False),
+    "comments": ("comments", True),
+}
+
+
+def parse_timestamp(value: str) -> int:
+    # Much faster than strptime; GitHub timestamps are ISO 8601 in UTC
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def format_timestamp(timestamp: int) -> str:
+    return time.strftime(DATE_FORMAT, time.gmtime(timestamp))
+
+
+class IssueDataset:
+    def __init__(self, rows: Iterable[Dict[str, str]]):
+        self.urls = []
+        self.titles = []
+        self.bodies = []
+        self.repositories = []
+        self.labels: list = []
+        self.created_at = array("q")
+        self.updated_at = array("q")
+        self.comments = array("q")
+        self.reactions = array("q")
+        self.orders: Dict[str, array] = {}
+        self.ranks: Dict[str, array] = {}
+        self.lock = threading.Lock()
+
+        # Issues with the same labels share one tuple
+        label_sets: Dict[str, Tuple[str, ...]] = {}
+        for row in rows:
+            labels = row["Labels"]
+            if labels not in label_sets:
+                label_sets[labels] = (
+                    tuple(sys.intern(label) for label in labels.split(", "))
+                    if labels
+                    else ()
+                )
+            self.urls.append(row["Issue URL"])
+            self.titles.append(row["Issue Title"])
+            self.bodies.append(row["Issue Body"])
+            self.repositories.append(sys.intern(row["Repository"]))
+            self.labels.append(label_sets[labels])
+            self.created_at.append(parse_timestamp(row["Created At"]))
+            self.updated_at.append(parse_timestamp(row["Updated At"]))
+            self.comments.append(int(row["Comments"]))
+            self.reactions.append(int(row["Total Reactions"]))
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def order(self, sort: str) -> array:
+        """
+        Row indexes in `sort` order; raises KeyError for unknown sorts. Ties
+        keep file order, like sorting the rows themselves did.
+        """
+        if sort not in self.orders:
+            column, descending = SORTS[sort]
+            values = getattr(self, column)
+            with self.lock:
+                if sort not in self.orders:
+                    self.orders[sort] = array(
+                        "l",
+                        sorted(
+                            range(len(self)), key=values.__getitem__, reverse=descending
+                        ),
+                    )
+        return self.orders[sort]
+
+    def rank(self, sort: str) -> array:
+        """
+        Position of every row in `sort` order, the inverse of `order(sort)`.
+        """
+        if sort not in self.ranks:
+            order = self.order(sort)
+            rank = array("l", bytes(order.itemsize * len(order)))
+            for position, index in enumerate(order):
+                rank[index] = position
+            self.ranks[sort] = rank
+        return self.ranks[sort]
+
+    def row(self, index: int) -> Dict[str, str]:
+        return {
+            "Repository": self.repositories[index],
+            "Issue URL": self.urls[index],
+            "Issue Title": self.titles[index],
+            "Issue Body": self.bodies[index],
+            "Created At": format_timestamp(self.created_at[index]),
+            "Updated At": format_timestamp(self.updated_at[index]),
+            "Labels": ", ".join(self.labels[index]),
+            "Comments": self.comments[index],
+            "Total Reactions": self.reactions[index],
+        }
+
+    def rows(self, sort: str) -> Iterator[Dict[str, str]]:
+        return map(self.row, self.order(sort))
@@ -0,0 +1,124 @@
+"""
+Repository and label facets over an IssueDataset for serve_github_issues.py.
+
+Filters are bitsets of rows, stored as a Python int with bit i set for row
+i, and combined with integer and/or/not, which run in C over n/8 bytes.
+Repositories and labels covering at least `DENSE_RATIO` of all rows are
+stored as such bitsets and counted with popcounts. Most cover only a handful
+of rows, so they are stored as sorted arrays of row indexes instead, which
+take far less memory than n bits each.
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Tuple, Union
+
+from issue_dataset import IssueDataset
+
+# Below this share of all rows, matches are sorted by rank instead of
+# scanning the whole sort order
+SPARSE_RATIO = 0.1
+
+# From this share of all rows on, n bits take less memory than a 4-byte row
+# index per row
+DENSE_RATIO = 1 / 32
+
+# Bitset or sorted row indexes
+Facet = Union[int, array]
+
+
+def to_bitset(rows: Iterable[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for index in rows:
+        bits[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(bits, "little")
+
+
+def bit_string(mask: int, size: int) -> str:
+    # Character i is "1" iff row i is set
+    return format(mask, f"0{size}b")[::-1] if size else ""
+
+
+class FacetIndex:
+    def __init__(self, dataset: IssueDataset):
+        self.size = len(dataset)
+        self.all = (1 << self.size) - 1
+        repos: Dict[str, List[int]] = {}
+        labels: Dict[str, List[int]] = {}
+        for index in range(self.size):
+            repos.setdefault(dataset.repositories[index], []).append(index)
+            for label in dataset.labels[index]:
+                labels.setdefault(label, []).append(index)
+        self.repos = {repo: self.to_facet(rows) for repo, rows in repos.items()}
+        self.labels = {label: self.to_facet(rows) for label, rows in labels.items()}
+
+    def to_facet(self, rows: List[int]) -> Facet:
+        if len(rows) >= self.size * DENSE_RATIO:
+            return to_bitset(rows, self.size)
+        return array("i", rows)
+
+    def mask(
+        self, repos: List[str], labels: List[str], exclude_labels: List[str]
+    ) -> int:
+        """
+        Rows in any of `repos` (or all repos if empty) with any of `labels`
+        (or any labels if empty) and none of `exclude_labels`.
+        """
+        mask = self.all
+        if repos:
+            mask &= self.union(self.repos, repos)
+        if labels:
+            mask &= self.union(self.labels, labels)
+        if exclude_labels:
+            mask &= ~self.union(self.labels, exclude_labels)
+        return mask
+
+    def union(self, facets: Dict[str, Facet], names: List[str]) -> int:
+        mask = 0
+        rows: List[int] = []
+        for name in names:
+            facet = facets.get(name, 0)
+            if isinstance(facet, int):
+                mask |= facet
+            else:
+                rows.extend(facet)
+        return mask | to_bitset(rows, self.size) if rows else mask
+
+    def counts(self, mask: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Number of rows in `mask` per repository and per label, most first.
+        """
+        bits = bit_string(mask, self.size)
+
+        def count_facet(facet: Facet) -> int:
+            if isinstance(facet, int):
+                return (facet & mask).bit_count()
+            if mask == self.all:
+                return len(facet)
+            return sum(bits[index] == "1" for index in facet)
+
+        def count(facets: Dict[str, Facet]) -> Dict[str, int]:
+            counts = ((name, count_facet(facet)) for name, facet in facets.items())
+            return dict(
+                sorted(
+                    ((name, n) for name, n in counts if n),
+                    key=lambda item: (-item[1], item[0]),
+                )
+            )
+
+        return count(self.repos), count(self.labels)
+
+    def select(self, mask: int, order: array, rank: array) -> List[int]:
+        """
+        The rows in `mask`, in the sort order given by `order` and its
+        inverse `rank`.
+        """
+        bits = bit_string(mask, self.size)
+        if mask.bit_count() > self.size * SPARSE_RATIO:
+            return [index for index in order if bits[index] == "1"]
+        rows = []
+        index = bits.find("1")
+        while index != -1:
+            rows.append(index)
+            index = bits.find("1", index + 1)
+        rows.sort(key=rank.__getitem__)
+        return rows
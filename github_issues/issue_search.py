@@ -0,0 +1,105 @@
+"""
+Full-text search over an IssueDataset for serve_github_issues.py.
+
+An inverted index maps every word of the issue titles, bodies and labels to
+the issues containing it, and matches are ranked with BM25. Title and label
+words count more than body words. A query word ending in `*` matches every
+word starting with it, e.g. `async*` finds async, asyncio and async-std.
+"""
+
+import bisect
+import collections
+import math
+import re
+from array import array
+from typing import Dict, List, Tuple
+
+from issue_dataset import IssueDataset
+
+WORD = re.compile(r"\w+")
+
+# How many body words a title or label word is worth
+FIELD_WEIGHTS = {"title": 3, "labels": 3, "body": 1}
+
+# Standard BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+class SearchIndex:
+    def __init__(self, dataset: IssueDataset):
+        # Term -> (row indexes, weighted term frequencies), in row order
+        postings: Dict[str, Tuple[array, array]] = {}
+        lengths = array("I")
+        for index in range(len(dataset)):
+            # Counter counts a list in C, much faster than word by word
+            counts = collections.Counter(tokenize(dataset.bodies[index]))
+            for word in tokenize(dataset.titles[index]):
+                counts[word] += FIELD_WEIGHTS["title"]
+            for word in tokenize(" ".join(dataset.labels[index])):
+                counts[word] += FIELD_WEIGHTS["labels"]
+            for word, count in counts.items():
+                if word not in postings:
+                    postings[word] = (array("i"), array("I"))
+                rows, frequencies = postings[word]
+                rows.append(index)
+                frequencies.append(count)
+            lengths.append(sum(counts.values()))
+        self.size = len(dataset)
+        self.postings = postings
+        average = sum(lengths) / len(lengths) if lengths else 1.0
+        self.norms = array("d", (K1 * (1 - B + B * length / average) for length in lengths))
+        # Term -> BM25 score of every posting, computed the first time the
+        # term is searched for
+        self.scores: Dict[str, array] = {}
+        # Sorted for prefix lookups
+        self.terms = sorted(postings)
+
+    def term_scores(self, term: str) -> array:
+        if term not in self.scores:
+            rows, frequencies = self.postings[term]
+            idf = math.log(1 + (self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+            norms = self.norms
+            # Computing it twice from two threads is harmless
+            self.scores[term] = array(
+                "d",
+                (
+                    idf * frequency * (K1 + 1) / (frequency + norms[index])
+                    for index, frequency in zip(rows, frequencies)
+                ),
+            )
+        return self.scores[term]
+
+    def expand(self, word: str) -> List[str]:
+        if not word.endswith("*"):
+            return [word] if word in self.postings else []
+        prefix = word[:-1]
+        start = bisect.bisect_left(self.terms, prefix)
+        end = start
+        while end < len(self.terms) and self.terms[end].startswith(prefix):
+            end += 1
+        return self.terms[start:end]
+
+    def search(self, query: str) -> List[int]:
+        """
+        Row indexes of the issues matching any word of `query`, best first.
+        """
+        scores: Dict[int, float] = {}
+        get = scores.get
+        # \w+ drops the *, so prefix words are found separately
+        for word, star in re.findall(r"(\w+)(\*?)", query.lower()):
+            for term in self.expand(word + star):
+                rows = self.postings[term][0]
+                term_scores = self.term_scores(term)
+                if not scores:
+                    scores = dict(zip(rows, term_scores))
+                    get = scores.get
+                    continue
+                for index, score in zip(rows, term_scores):
+                    scores[index] = get(index, 0.0) + score
+        # Stable, so ties stay in the order they were found
+        return sorted(scores, key=scores.__getitem__, reverse=True)
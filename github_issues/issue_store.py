@@ -0,0 +1,150 @@
+"""
+SQLite issue store, an alternative to exchanging issues as CSV files.
+
+Issues are keyed by `Issue URL`, and upserts keep the row with the newest
+`Updated At` like merge_issue_csvs.py, so an update only touches the rows
+that changed. Repository, timestamps, comments and reactions are indexed.
+
+Every script accepts a store wherever it accepts a CSV file: paths ending in
+one of `STORE_EXTENSIONS` are opened as a store.
+"""
+
+import sqlite3
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Set
+
+STORE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# CSV field name -> column name, in CSV order
+COLUMNS = {
+    "Repository": "repository",
+    "Issue URL": "url",
+    "Issue Title": "title",
+    "Issue Body": "body",
+    "Created At": "created_at",
+    "Updated At": "updated_at",
+    "Labels": "labels",
+    "Comments": "comments",
+    "Total Reactions": "reactions",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    url TEXT PRIMARY KEY,
+    repository TEXT NOT NULL,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    comments INTEGER NOT NULL,
+    reactions INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS issues_repository ON issues (repository);
+CREATE INDEX IF NOT EXISTS issues_created_at ON issues (created_at);
+CREATE INDEX IF NOT EXISTS issues_updated_at ON issues (updated_at);
+CREATE INDEX IF NOT EXISTS issues_comments ON issues (comments);
+CREATE INDEX IF NOT EXISTS issues_reactions ON issues (reactions);
+-- Repos written by an unfinished pull, see pull_github_issues.py --resume
+CREATE TABLE IF NOT EXISTS checkpoints (repository TEXT PRIMARY KEY);
+"""
+
+# Lexicographic comparison works for ISO 8601 dates
+UPSERT = f"""
+INSERT INTO issues ({", ".join(COLUMNS.values())})
+VALUES ({", ".join("?" * len(COLUMNS))})
+ON CONFLICT (url) DO UPDATE SET
+    {", ".join(f"{column} = excluded.{column}" for column in COLUMNS.values() if column != "url")}
+WHERE excluded.updated_at > issues.updated_at
+"""
+
+
+def is_store(path: str) -> bool:
+    return path.lower().endswith(STORE_EXTENSIONS)
+
+
+def to_params(row: Dict[str, str]) -> tuple:
+    # The API returns no body rather than an empty one
+    return tuple("" if row[field] is None else row[field] for field in COLUMNS)
+
+
+class IssueStore:
+    """
+    Rows go in and come out as dicts with the same keys as the CSV files.
+    Changes are committed by `commit()` or on leaving a `with` block.
+    """
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+
+    def upsert(self, rows: Iterable[Dict[str, str]]) -> None:
+        self.db.executemany(UPSERT, map(to_params, rows))
+
+    def delete(self, urls: Iterable[str]) -> int:
+        cursor = self.db.executemany(
+            "DELETE FROM issues WHERE url = ?", ((url,) for url in urls)
+        )
+        return cursor.rowcount
+
+    def delete_repos(self, repos: Iterable[str]) -> int:
+        cursor = self.db.executemany(
+            "DELETE FROM issues WHERE repository = ?", ((repo,) for repo in repos)
+        )
+        return cursor.rowcount
+
+    def replace_repo(self, repo_full_name: str, rows: Iterable[Dict[str, str]]) -> None:
+        self.delete_repos([repo_full_name])
+        self.upsert(rows)
+
+    def rows(
+        self,
+        where: Optional[str] = None,
+        params: Sequence = (),
+        order_by: str = "rowid",
+    ) -> Iterator[Dict[str, str]]:
+        """
+        Yield the rows matching the SQL condition `where`. The default order is
+        insertion order, which upserts preserve, like merging dicts does.
+        """
+        query = f"SELECT {', '.join(COLUMNS.values())} FROM issues"
+        if where:
+            query += f" WHERE {where}"
+        for values in self.db.execute(f"{query} ORDER BY {order_by}", params):
+            yield dict(zip(COLUMNS, values))
+
+    def clear(self) -> None:
+        self.db.execute("DELETE FROM issues")
+        self.db.execute("DELETE FROM checkpoints")
+
+    def checkpoints(self) -> Set[str]:
+        return {repo for (repo,) in self.db.execute("SELECT repository FROM checkpoints")}
+
+    def checkpoint(self, repo_full_name: str) -> None:
+        self.db.execute(
+            "INSERT OR IGNORE INTO checkpoints (repository) VALUES (?)",
+            (repo_full_name,),
+        )
+
+    def clear_checkpoints(self) -> None:
+        self.db.execute("DELETE FROM checkpoints")
+
+    def repos(self) -> Set[str]:
+        return {repo for (repo,) in self.db.execute("SELECT DISTINCT repository FROM issues")}
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
@@ -3,6 +3,11 @@ __author__ = "GPT-4"
 import argparse
 import csv
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from compression import compression_for, open_text
+from issue_store import IssueStore, is_store
 
 # Increase max CSV field size
 maxInt = sys.maxsize
@@ -13,44 +18,174 @@ while True:
     except OverflowError:
         maxInt = int(maxInt / 10)
 
-parser = argparse.ArgumentParser(description="Merge and deduplicate csv files.")
-parser.add_argument(
-    "csvfiles", metavar="N", type=str, nargs="+", help="CSV files to merge"
-)
-parser.add_argument("-o", "--output", required=True, help="Output csv file.")
-parser.add_argument(
-    "--encoding", type=str, default="utf8", help="The encoding of the CSV file"
-)
 
-args = parser.parse_args()
+def read_csv(filename, encoding="utf8"):
+    with open_text(filename, "r", encoding=encoding) as file:
+        return [row for row in csv.DictReader(file)]
 
 
-def read_csv(filename):
-    with open(filename, "r", encoding=args.encoding) as file:
-        return [row for row in csv.DictReader(file)]
+def iter_issues(filename: str, encoding: str = "utf8") -> Iterator[dict]:
+    # Rows of a CSV file or an issue store, see issue_store.py
+    if is_store(filename):
+        with IssueStore(filename) as store:
+            yield from store.rows()
+    else:
+        with open_text(filename, "r", encoding=encoding) as file:
+            yield from csv.DictReader(file)
 
 
-def write_csv(data, filename):
+def write_csv(data, filename, encoding="utf8"):
     if data:
-        with open(filename, "w", encoding=args.encoding) as file:
+        with open_text(filename, "w", encoding=encoding) as file:
             writer = csv.DictWriter(file, fieldnames=data[0].keys())
             writer.writeheader()
             writer.writerows(data)
 
 
-# Dictionary to hold data with "Issue URL" as the key and the entire row as the value
-data_dict = {}
+def merge_row(data_dict: Dict[str, dict], row: dict) -> None:
+    url = row["Issue URL"]
+    # Lexicographic sort works for ISO 8601 dates
+    if url not in data_dict or row["Updated At"] > data_dict[url]["Updated At"]:
+        data_dict[url] = row
+
+
+def reduce_file(filename: str, encoding: str = "utf8") -> Dict[str, dict]:
+    # Newest row per URL within one file; merging these partial results in
+    # file order gives the same rows and order as merging every row serially
+    data_dict = {}
+    for row in iter_issues(filename, encoding):
+        merge_row(data_dict, row)
+    return data_dict
+
+
+def iter_records(file: BinaryIO, encoding: str) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Yield (byte offset, fields) for every CSV record from the current position
+    of a binary file.
+    """
+    position = file.tell()
+
+    def lines():
+        nonlocal position
+        for line in iter(file.readline, b""):
+            position += len(line)
+            # Same newline translation as opening the file in text mode
+            yield line.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+
+    start = position
+    # csv.reader pulls exactly the lines of one record at a time, so `position`
+    # is the end of the record just returned
+    for fields in csv.reader(lines()):
+        yield start, fields
+        start = position
+
+
+def merge_streaming(filenames: List[str], output: str, encoding: str = "utf8") -> None:
+    """
+    Same result as merging in memory, but only keeps an index of
+    URL -> (Updated At, file, byte offset) in memory.
+
+    A first pass indexes the newest version of every issue, and a second pass
+    seeks to each winning row and copies it to the output.
+    """
+    files = [open(filename, "rb") for filename in filenames]
+    try:
+        headers = []
+        index: Dict[str, Tuple[str, int, int]] = {}
+        for file_index, file in enumerate(files):
+            records = iter_records(file, encoding)
+            header = next(records, (0, None))[1]
+            headers.append(header)
+            if header is None:
+                continue
+            url_column = header.index("Issue URL")
+            updated_column = header.index("Updated At")
+            for offset, fields in records:
+                if not fields:
+                    continue  # DictReader skips blank lines too
+                url, updated_at = fields[url_column], fields[updated_column]
+                # Lexicographic sort works for ISO 8601 dates
+                if url not in index or updated_at > index[url][0]:
+                    index[url] = (updated_at, file_index, offset)
+
+        if not index:
+            return
+        first_file = next(iter(index.values()))[1]
+        with open_text(output, "w", encoding=encoding) as out:
+            writer = csv.DictWriter(out, fieldnames=headers[first_file])
+            writer.writeheader()
+            for _, file_index, offset in index.values():
+                file = files[file_index]
+                file.seek(offset)
+                fields = next(iter_records(file, encoding))[1]
+                writer.writerow(dict(zip(headers[file_index], fields)))
+    finally:
+        for file in files:
+            file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge and deduplicate csv files.")
+    parser.add_argument(
+        "csvfiles", metavar="N", type=str, nargs="+", help="CSV files to merge"
+    )
+    parser.add_argument("-o", "--output", required=True, help="Output csv file.")
+    parser.add_argument(
+        "--encoding", type=str, default="utf8", help="The encoding of the CSV file"
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Index the inputs and copy winning rows instead of loading every row",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to parse input files with",
+    )
+
+    args = parser.parse_args()
+    if args.low_memory and args.workers > 1:
+        parser.error("--workers can't be combined with --low-memory")
+    if args.low_memory and any(
+        is_store(filename) or compression_for(filename) for filename in args.csvfiles
+    ):
+        # The second pass seeks back and forth within the inputs
+        parser.error("--low-memory only works with uncompressed CSV inputs")
+
+    if is_store(args.output):
+        # Upserted row by row, so memory stays flat without --low-memory, and
+        # rows already in the store take part in the merge
+        with IssueStore(args.output) as store:
+            for filename in args.csvfiles:
+                store.upsert(iter_issues(filename, args.encoding))
+    elif args.low_memory:
+        merge_streaming(args.csvfiles, args.output, args.encoding)
+    else:
+        # Dictionary to hold data with "Issue URL" as the key and the entire row as the value
+        data_dict = {}
+
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                partials = executor.map(
+                    reduce_file, args.csvfiles, [args.encoding] * len(args.csvfiles)
+                )
+                for partial in partials:
+                    for row in partial.values():
+                        merge_row(data_dict, row)
+        else:
+            for filename in args.csvfiles:
+                for row in iter_issues(filename, args.encoding):
+                    merge_row(data_dict, row)
+
+        # Convert the dictionary values to a list for writing to the CSV
+        data_list = list(data_dict.values())
 
-for filename in args.csvfiles:
-    for row in read_csv(filename):
-        url = row["Issue URL"]
-        # Lexicographic sort works for ISO 8601 dates
-        if url not in data_dict or row["Updated At"] > data_dict[url]["Updated At"]:
-            data_dict[url] = row
+        write_csv(data_list, args.output, args.encoding)
 
-# Convert the dictionary values to a list for writing to the CSV
-data_list = list(data_dict.values())
+    print(f"Successfully merged {len(args.csvfiles)} files into {args.output}.")
 
-write_csv(data_list, args.output)
 
-print(f"Successfully merged {len(args.csvfiles)} files into {args.output}.")
+if __name__ == "__main__":
+    main()
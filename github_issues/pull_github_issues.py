@@ -4,25 +4,35 @@ Script to pull open GitHub issues from all repositories the user has starred.
 Author: GPT-4
 
 Usage:
-  python pull_github_issues.py --max_issues <max_issues> --days <days> --output <output.csv>
+  python pull_github_issues.py --max_issues <max_issues> --days <days> --output <output.csv[.gz|.zst]> [--concurrency <n>] [--no-cache] [--incremental] [--engine graphql|search [--label <label>]] [--resume] [--help-wanted [--good-first-issue] [--accepting-prs]]
+  python pull_github_issues.py --daemon --budget <requests_per_hour> --output <output.csv>
 """
 
 import argparse
 import csv
-import requests
+import heapq
+import itertools
+import json
 import sys
 import logging
+import shutil
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import os
 from dotenv import load_dotenv
+from compression import compression_for, open_binary, open_text
+from get_help_wanted import filter_issues
+from github_client import API_URL, LISTING_WORKERS, GitHubClient, StarredRepo
+from http_cache import DEFAULT_CACHE_DIR, ResponseCache
+from issue_store import IssueStore, is_store
+from merge_issue_csvs import merge_row, read_csv
+from rate_limit import load_tokens
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get API_TOKEN from environment variables
-API_TOKEN = os.getenv("API_TOKEN")
-
 # Increase CSV field size limit
 maxInt = sys.maxsize
 while True:
@@ -35,28 +45,76 @@ while True:
 # Setting up logging
 logging.basicConfig(level=logging.INFO)
 
-headers = {"Authorization": f"token {API_TOKEN}"}
+# Issue requests are spread over API_TOKEN, API_TOKEN_2, ...
+client = GitHubClient(load_tokens("API_TOKEN"))
+
+FIELDNAMES = [
+    "Repository",
+    "Issue URL",
+    "Issue Title",
+    "Issue Body",
+    "Created At",
+    "Updated At",
+    "Labels",
+    "Comments",
+    "Total Reactions",
+]
 
 
-def get_next_page_link(link_header: str) -> Optional[str]:
-    if link_header:
-        links = link_header.split(", ")
-        for link in links:
-            url, rel = link.split("; ")
-            if rel == 'rel="next"':
-                return url.strip("<>")
-    return None
+def plan_repos(repos: List[StarredRepo], days: int, skip_inactive: bool) -> List[str]:
+    """
+    Drop repos that can't produce any rows, using the metadata that comes with
+    the starred listing for free.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    planned = []
+    for repo in repos:
+        # open_issues_count includes PRs, so zero really means nothing is open
+        if repo.archived or not repo.has_issues or repo.open_issues_count == 0:
+            continue
+        # Issue activity doesn't always bump pushed_at/updated_at, hence opt-in
+        if skip_inactive and max(repo.pushed_at or "", repo.updated_at or "") < cutoff:
+            continue
+        planned.append(repo.full_name)
+    logging.info(f"Fetching issues for {len(planned)} of {len(repos)} starred repos")
+    return planned
 
 
-def get_starred_repos() -> List[str]:
-    url = "https://api.github.com/user/starred?per_page=100"
-    all_repos = []
-    while url:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        all_repos.extend([repo["full_name"] for repo in response.json()])
-        url = get_next_page_link(response.headers.get("Link", ""))
-    return all_repos
+def drop_repos(issues, state: Dict[str, str], planned: Iterable[str]) -> int:
+    """
+    Forget the repos of an incremental dataset that are no longer polled,
+    i.e. not in `planned`: those that were unstarred and those plan_repos now
+    skips. Their rows could otherwise never be closed or removed, and a full
+    pull wouldn't have them either.
+    """
+    dropped = (set(state) | issues.repos()).difference(planned)
+    for repo in dropped:
+        state.pop(repo, None)
+    return issues.delete_repos(dropped)
+
+
+def issue_to_row(repo_full_name: str, issue: dict) -> dict:
+    return {
+        "Repository": repo_full_name,
+        "Issue URL": issue["html_url"],
+        "Issue Title": issue["title"],
+        "Issue Body": issue["body"],
+        "Created At": issue["created_at"],
+        "Updated At": issue["updated_at"],
+        "Labels": ", ".join(label["name"] for label in issue["labels"]),
+        "Comments": issue["comments"],
+        "Total Reactions": issue["reactions"]["total_count"],
+    }
+
+
+def is_wanted(issue: dict, cutoff_date: datetime) -> bool:
+    created_at = datetime.strptime(issue["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+    return (
+        issue.get("state", "open") == "open"
+        and "pull_request" not in issue
+        and created_at >= cutoff_date
+        and not issue["assignee"]
+    )
 
 
 def get_issues(repo_full_name: str, max_issues: int, days: int) -> List[dict]:
@@ -66,38 +124,711 @@ def get_issues(repo_full_name: str, max_issues: int, days: int) -> List[dict]:
         "sort": "updated",
         "direction": "desc",
         "per_page": 100,
-        "since": cutoff_date.isoformat(),
+        # Rounded down to the day so runs during the same day hit the same
+        # cached URL; issues from the extra window are dropped by the
+        # created_at check below anyway
+        "since": cutoff_date.replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ).isoformat(),
     }
-    url = f"https://api.github.com/repos/{repo_full_name}/issues"
-    all_issues = []
-    while url and len(all_issues) < max_issues:
-        response = requests.get(url, headers=headers, params=params)
+    url = f"{API_URL}/repos/{repo_full_name}/issues"
+    all_issues = (
+        issue_to_row(repo_full_name, issue)
+        for issue in client.paginate(url, params)
+        if is_wanted(issue, cutoff_date)
+    )
+    # Pages are fetched lazily, so this stops paging once max_issues is reached
+    return list(itertools.islice(all_issues, max_issues))
+
+
+def get_issue_updates(
+    repo_full_name: str, max_issues: int, days: int, since: Optional[str]
+) -> Tuple[List[dict], List[str], Optional[str]]:
+    """
+    Fetch only the issues updated since the repo's watermark.
+
+    Returns the rows to upsert, the URLs of issues that were closed or assigned
+    since and should be dropped, and the new watermark.
+
+    Only the first fetch is capped at `max_issues`: the watermark moves past
+    every issue seen, so the walk has to cover all changes since it. Issues
+    updated at the watermark itself aren't returned again.
+    """
+    if since is None:
+        return get_issues(repo_full_name, max_issues, days), [], None
+
+    cutoff_date = datetime.now() - timedelta(days=days)
+    params = {
+        # Closed issues are needed too, so they can be removed from the dataset
+        "state": "all",
+        "sort": "updated",
+        "direction": "desc",
+        "per_page": 100,
+        "since": since,
+    }
+    url = f"{API_URL}/repos/{repo_full_name}/issues"
+    updated, removed = [], []
+    watermark = since
+    for issue in client.paginate(url, params):
+        # since is inclusive, so the issues at the watermark come back every
+        # time; they were handled by the previous sync
+        if issue["updated_at"] <= since:
+            continue
+        watermark = max(watermark, issue["updated_at"])
+        if is_wanted(issue, cutoff_date):
+            updated.append(issue_to_row(repo_full_name, issue))
+        elif "pull_request" not in issue:
+            removed.append(issue["html_url"])
+    return updated, removed, watermark
+
+
+GRAPHQL_URL = f"{API_URL}/graphql"
+
+# Only the fields that end up in the CSV; PRs and assigned issues are filtered
+# out server-side instead of after the download
+GRAPHQL_REPO_ISSUES = """
+  {alias}: repository(owner: {owner}, name: {name}) {{
+    issues(first: {first}{after}, states: OPEN, filterBy: {{since: $since, assignee: null}}, orderBy: {{field: UPDATED_AT, direction: DESC}}) {{
+      pageInfo {{ hasNextPage endCursor }}
+      nodes {{
+        url title body createdAt updatedAt
+        labels(first: 100) {{ nodes {{ name }} }}
+        comments {{ totalCount }}
+        reactions {{ totalCount }}
+      }}
+    }}
+  }}"""
+
+
+def graphql_issue_to_row(repo_full_name: str, node: dict) -> dict:
+    return {
+        "Repository": repo_full_name,
+        "Issue URL": node["url"],
+        "Issue Title": node["title"],
+        "Issue Body": node["body"],
+        "Created At": node["createdAt"],
+        "Updated At": node["updatedAt"],
+        "Labels": ", ".join(label["name"] for label in node["labels"]["nodes"]),
+        "Comments": node["comments"]["totalCount"],
+        "Total Reactions": node["reactions"]["totalCount"],
+    }
+
+
+def get_issues_graphql(
+    repos: List[str], max_issues: int, days: int
+) -> List[Optional[List[dict]]]:
+    """
+    Fetch issues for a batch of repos with one aliased GraphQL query per page.
+
+    Returns one list of rows per repo, or None for repos that failed.
+    """
+    cutoff_date = datetime.now() - timedelta(days=days)
+    variables = {
+        "since": cutoff_date.replace(minute=0, second=0, microsecond=0).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"
+        )
+    }
+    all_issues = {repo: [] for repo in repos}
+    cursors: Dict[str, Optional[str]] = {repo: None for repo in repos}
+    failed = set()
+    pending = list(repos)
+    while pending:
+        aliases = {f"r{i}": repo for i, repo in enumerate(pending)}
+        query = "query($since: DateTime) {%s\n}" % "".join(
+            GRAPHQL_REPO_ISSUES.format(
+                alias=alias,
+                owner=json.dumps(repo.split("/")[0]),
+                name=json.dumps(repo.split("/")[1]),
+                first=min(max_issues, 100),
+                after=f", after: {json.dumps(cursors[repo])}" if cursors[repo] else "",
+            )
+            for alias, repo in aliases.items()
+        )
+        response = client.request(
+            "POST", GRAPHQL_URL, json={"query": query, "variables": variables}
+        )
         response.raise_for_status()
-        for issue in response.json():
-            created_at = datetime.strptime(issue["created_at"], "%Y-%m-%dT%H:%M:%SZ")
-            if "pull_request" in issue or created_at < cutoff_date or issue["assignee"]:
+        payload = response.json()
+
+        # Errors only void the repos they point at
+        for error in payload.get("errors", []):
+            path = error.get("path") or []
+            if path and path[0] in aliases:
+                repo = aliases[path[0]]
+                logging.error(f"Failed to process repo {repo}: {error.get('message')}")
+                failed.add(repo)
+        if payload.get("data") is None:
+            raise RuntimeError(f"GraphQL query failed: {payload.get('errors')}")
+
+        next_pending = []
+        for alias, repo in aliases.items():
+            node = payload["data"].get(alias)
+            if repo in failed or node is None:
+                failed.add(repo)
+                continue
+            issues = all_issues[repo]
+            for issue in node["issues"]["nodes"]:
+                created_at = datetime.strptime(issue["createdAt"], "%Y-%m-%dT%H:%M:%SZ")
+                if created_at < cutoff_date:
+                    continue
+                issues.append(graphql_issue_to_row(repo, issue))
+                if len(issues) >= max_issues:
+                    break
+            page_info = node["issues"]["pageInfo"]
+            if len(issues) < max_issues and page_info["hasNextPage"]:
+                cursors[repo] = page_info["endCursor"]
+                next_pending.append(repo)
+        pending = next_pending
+    return [None if repo in failed else all_issues[repo] for repo in repos]
+
+
+# GitHub rejects search queries longer than this
+SEARCH_QUERY_LIMIT = 256
+
+
+def search_queries(repos: List[str], label: str, cutoff_date: datetime) -> List[Tuple[str, List[str]]]:
+    """
+    Split repos into search queries for one label that fit SEARCH_QUERY_LIMIT.
+    """
+    base = f'is:issue is:open no:assignee label:"{label}" created:>={cutoff_date:%Y-%m-%d}'
+    queries = []
+    query, chunk = base, []
+    for repo in repos:
+        qualifier = f" repo:{repo}"
+        if chunk and len(query) + len(qualifier) > SEARCH_QUERY_LIMIT:
+            queries.append((query, chunk))
+            query, chunk = base, []
+        query += qualifier
+        chunk.append(repo)
+    if chunk:
+        queries.append((query, chunk))
+    return queries
+
+
+def get_issues_search(
+    repos: List[str], labels: List[str], max_issues: int, days: int
+) -> List[Optional[List[dict]]]:
+    """
+    Fetch only the issues carrying one of `labels` for a batch of repos through
+    the issue Search API.
+
+    Returns one list of rows per repo, newest update first.
+    """
+    cutoff_date = datetime.now() - timedelta(days=days)
+    # Search results name repos by API URL, possibly in a different case
+    names = {repo.lower(): repo for repo in repos}
+    all_issues = {repo: {} for repo in repos}
+    # One query set per label, since repeated label: qualifiers mean AND
+    for label in labels:
+        for query, chunk in search_queries(repos, label, cutoff_date):
+            params = {"q": query, "sort": "updated", "order": "desc", "per_page": 100}
+            for issue in client.paginate(f"{API_URL}/search/issues", params, key="items"):
+                owner, name = issue["repository_url"].split("/")[-2:]
+                repo = names.get(f"{owner}/{name}".lower())
+                if repo is None or not is_wanted(issue, cutoff_date):
+                    continue
+                all_issues[repo][issue["html_url"]] = issue_to_row(repo, issue)
+
+    return [
+        sorted(
+            all_issues[repo].values(), key=lambda row: row["Updated At"], reverse=True
+        )[:max_issues]
+        for repo in repos
+    ]
+
+
+def fetch_batch(fetch: Callable, repos: List[str], *args) -> List[Optional[List[dict]]]:
+    try:
+        logging.info(f"Processing {len(repos)} repos starting at {repos[0]}")
+        return fetch(repos, *args)
+    except Exception as e:
+        logging.error(f"Failed to process repos {', '.join(repos)}: {str(e)}")
+        return [None] * len(repos)
+
+
+def fetch_repo(repo_full_name: str, fetch: Callable, *args):
+    # Errors are isolated per repo so one failure doesn't abort the whole pull
+    try:
+        logging.info(f"Processing {repo_full_name}")
+        return fetch(repo_full_name, *args)
+    except Exception as e:
+        logging.error(f"Failed to process repo {repo_full_name}: {str(e)}")
+        return None
+
+
+def load_state(path: str) -> Dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+def save_state(path: str, state: Dict[str, str]) -> None:
+    with open(f"{path}.tmp", "w", encoding="utf8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_issues(path: str, issues: List[dict], encoding: str) -> None:
+    # Written aside and swapped in, so readers never see a partial file
+    with open_text(f"{path}.tmp", "w", newline="", encoding=encoding, like=path) as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(issues)
+    os.replace(f"{path}.tmp", path)
+
+
+class CheckpointedWriter:
+    """
+    Appends each repo's rows to the output CSV as soon as they are fetched.
+
+    After every repo, the CSV size and the repo name are recorded in a journal
+    next to the output, so an interrupted pull can be resumed from the last
+    completed repo. The journal is removed once the pull finishes.
+
+    The output is reopened for every repo, so a compressed output ends in a
+    complete gzip member or zstd frame at every checkpoint. Once the pull
+    finishes it is recompressed as one stream, which compresses far better.
+    """
+
+    def __init__(self, path: str, encoding: str, resume: bool = False):
+        self.path = path
+        self.encoding = encoding
+        self.journal_path = f"{path}.journal"
+        self.completed = set()
+        offset = None
+        if resume and os.path.exists(path) and os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf8") as journal:
+                for line in journal:
+                    if not line.endswith("\n"):
+                        break  # Torn write from the interrupted run
+                    size, repo = line.rstrip("\n").split("\t", 1)
+                    offset = int(size)
+                    self.completed.add(repo)
+
+        if offset is not None:
+            # Drop rows written after the last checkpoint
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+            self.journal = open(self.journal_path, "a", encoding="utf8")
+            logging.info(f"Resuming after {len(self.completed)} completed repos")
+        else:
+            with open_text(path, "w", newline="", encoding=encoding) as f:
+                csv.DictWriter(f, fieldnames=FIELDNAMES).writeheader()
+            self.journal = open(self.journal_path, "w", encoding="utf8")
+
+    def write_repo(self, repo_full_name: str, issues: List[dict]) -> None:
+        if issues:
+            with open_text(self.path, "a", newline="", encoding=self.encoding) as f:
+                csv.DictWriter(f, fieldnames=FIELDNAMES).writerows(issues)
+        size = os.path.getsize(self.path)
+        self.journal.write(f"{size}\t{repo_full_name}\n")
+        self.journal.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.journal.close()
+        if exc_type is None:
+            if compression_for(self.path):
+                tmp_path = f"{self.path}.tmp"
+                with (open_binary(self.path) as src,
+                      open_binary(tmp_path, "wb", like=self.path) as dst):
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp_path, self.path)
+            os.remove(self.journal_path)
+
+
+class StoreWriter:
+    """
+    CheckpointedWriter for an issue store: each repo's rows replace its old
+    ones and the repo is recorded as completed in the same transaction.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.store = IssueStore(path)
+        self.completed = self.store.checkpoints() if resume else set()
+        if self.completed:
+            logging.info(f"Resuming after {len(self.completed)} completed repos")
+        else:
+            self.store.clear()
+            self.store.commit()
+
+    def write_repo(self, repo_full_name: str, issues: List[dict]) -> None:
+        self.store.replace_repo(repo_full_name, issues)
+        self.store.checkpoint(repo_full_name)
+        self.store.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.store.clear_checkpoints()
+            self.store.commit()
+        self.store.close()
+
+
+class CsvIssues:
+    """
+    The in-memory counterpart of IssueStore for CSV outputs, which have to be
+    rewritten whole on every commit.
+    """
+
+    def __init__(self, path: str, encoding: str):
+        self.path = path
+        self.encoding = encoding
+        # Newest row per URL wins, same as merge_issue_csvs.py
+        self.data_dict = {}
+        if os.path.exists(path):
+            self.upsert(read_csv(path, encoding))
+
+    def upsert(self, rows: List[dict]) -> None:
+        for row in rows:
+            merge_row(self.data_dict, row)
+
+    def delete(self, urls: List[str]) -> int:
+        return sum(self.data_dict.pop(url, None) is not None for url in urls)
+
+    def delete_repos(self, repos: Iterable[str]) -> int:
+        repos = set(repos)
+        urls = [url for url, row in self.data_dict.items() if row["Repository"] in repos]
+        return self.delete(urls)
+
+    def repos(self) -> Set[str]:
+        return {row["Repository"] for row in self.data_dict.values()}
+
+    def commit(self) -> None:
+        write_issues(self.path, list(self.data_dict.values()), self.encoding)
+
+    def close(self) -> None:
+        pass
+
+
+def open_issues(path: str, encoding: str):
+    return IssueStore(path) if is_store(path) else CsvIssues(path, encoding)
+
+
+def stream_results(
+    pages: List["Future[List[StarredRepo]]"],
+    submit_page: Callable[[List[StarredRepo]], List[Tuple[List[str], Future]]],
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield (repo, result) pairs in starred order.
+
+    `submit_page` is called for each page of starred repos as soon as it
+    arrives and returns the submitted jobs, each covering a list of repos and
+    resolving to one result per repo. Listing and fetching thus overlap while
+    the output order stays deterministic.
+    """
+    page_jobs = []
+    for page in pages:
+        jobs = Future()
+
+        def on_page(page, jobs=jobs):
+            try:
+                jobs.set_result(submit_page(page.result()))
+            except Exception as e:
+                jobs.set_exception(e)
+
+        page.add_done_callback(on_page)
+        page_jobs.append(jobs)
+
+    for jobs in page_jobs:
+        for repos, results in jobs.result():
+            yield from zip(repos, results.result())
+
+
+def fetch_issues(
+    executor: Executor, pages: List[Future], args, completed: Set[str]
+) -> Iterator[Tuple[str, Optional[List[dict]]]]:
+    """
+    Fetch stage: yield (repo, rows) in starred order, or (repo, None) for
+    repos that failed. Repos in `completed` are skipped.
+    """
+
+    def submit_page(page: List[StarredRepo]) -> List[Tuple[List[str], Future]]:
+        repos = plan_repos(page, args.days, args.skip_inactive)
+        repos = [repo for repo in repos if repo not in completed]
+        if args.engine == "graphql":
+            batches = [
+                repos[i : i + args.batch_size]
+                for i in range(0, len(repos), args.batch_size)
+            ]
+            return [
+                (
+                    batch,
+                    executor.submit(
+                        fetch_batch,
+                        get_issues_graphql,
+                        batch,
+                        args.max_issues,
+                        args.days,
+                    ),
+                )
+                for batch in batches
+            ]
+        if args.engine == "search":
+            if not repos:
+                return []
+            # get_issues_search splits the page into query-length chunks
+            search = executor.submit(
+                fetch_batch,
+                get_issues_search,
+                repos,
+                args.label,
+                args.max_issues,
+                args.days,
+            )
+            return [(repos, search)]
+        return [
+            (
+                [repo],
+                executor.submit(
+                    lambda repo: [
+                        fetch_repo(repo, get_issues, args.max_issues, args.days)
+                    ],
+                    repo,
+                ),
+            )
+            for repo in repos
+        ]
+
+    return stream_results(pages, submit_page)
+
+
+def filter_results(
+    results: Iterator[Tuple[str, Optional[List[dict]]]], args
+) -> Iterator[Tuple[str, Optional[List[dict]]]]:
+    # Filter stage: only rows get_help_wanted.py would keep are written
+    for repo, issues in results:
+        if issues is not None:
+            issues = list(
+                filter_issues(issues, args.good_first_issue, args.accepting_prs)
+            )
+        yield repo, issues
+
+
+def split_wanted(rows: List[dict], args) -> Tuple[List[dict], List[str]]:
+    """
+    Apply the get_help_wanted.py filter to upserted rows. Returns the rows to
+    keep and the URLs of those rejected, which are removed from the dataset.
+    """
+    kept = list(filter_issues(rows, args.good_first_issue, args.accepting_prs))
+    kept_urls = {row["Issue URL"] for row in kept}
+    return kept, [row["Issue URL"] for row in rows if row["Issue URL"] not in kept_urls]
+
+
+def pull_all(executor: Executor, pages: List[Future], args) -> None:
+    if is_store(args.output):
+        writer = StoreWriter(args.output, args.resume)
+    else:
+        writer = CheckpointedWriter(args.output, args.encoding, args.resume)
+    with writer:
+        results = fetch_issues(executor, pages, args, writer.completed)
+        if args.help_wanted:
+            results = filter_results(results, args)
+        for repo, issues in results:
+            # Failed repos aren't journaled, so --resume retries them
+            if issues is not None:
+                writer.write_repo(repo, issues)
+
+
+def sync_incremental(executor: Executor, pages: List[Future], args) -> None:
+    """
+    Upsert issues updated since each repo's high-water mark into args.output.
+    """
+    state_path = args.state or f"{args.output}.state.json"
+    state = load_state(state_path)
+    issues = open_issues(args.output, args.encoding)
+    polled: List[str] = []
+
+    def submit_page(page: List[StarredRepo]) -> List[Tuple[List[str], Future]]:
+        planned = plan_repos(page, args.days, args.skip_inactive)
+        polled.extend(planned)
+        return [
+            (
+                [repo],
+                executor.submit(
+                    lambda repo: [
+                        fetch_repo(
+                            repo,
+                            get_issue_updates,
+                            args.max_issues,
+                            args.days,
+                            state.get(repo),
+                        )
+                    ],
+                    repo,
+                ),
+            )
+            for repo in planned
+        ]
+
+    num_updated = num_removed = 0
+    for repo, result in stream_results(pages, submit_page):
+        if result is None:
+            continue
+        updated, removed, watermark = result
+        # A full fetch has no watermark of its own; start from the newest row
+        if watermark is None and updated:
+            watermark = max(row["Updated At"] for row in updated)
+        if args.help_wanted:
+            updated, rejected = split_wanted(updated, args)
+            removed = removed + rejected
+        issues.upsert(updated)
+        num_removed += issues.delete(removed)
+        num_updated += len(updated)
+        if watermark is not None:
+            state[repo] = watermark
+    # Every page has been listed once the results are exhausted
+    num_removed += drop_repos(issues, state, polled)
+
+    issues.commit()
+    issues.close()
+    save_state(state_path, state)
+    logging.info(f"Upserted {num_updated} issues, removed {num_removed} issues")
+
+
+# How often the daemon re-reads the starred list
+LISTING_INTERVAL = 3600
+
+# Weight of the latest poll in a repo's estimated update rate
+RATE_SMOOTHING = 0.5
+
+
+def run_daemon(args) -> None:
+    """
+    Keep args.output up to date by polling each repo about as often as its
+    issues change.
+
+    Repos wait in a priority queue ordered by their next poll time. Each poll
+    is an incremental fetch; the number of changes it finds feeds a moving
+    average of the repo's updates per hour, and the next poll is scheduled
+    roughly one expected change later, clamped to the min/max interval. All
+    requests draw from a token bucket refilled at args.budget per hour.
+    """
+    state_path = args.state or f"{args.output}.state.json"
+    state = load_state(state_path)
+    issues = open_issues(args.output, args.encoding)
+
+    min_interval = args.min_interval * 60
+    max_interval = args.max_interval * 3600
+    rates: Dict[str, float] = {}
+    last_polls: Dict[str, float] = {}
+    queue: List[Tuple[float, str]] = []
+    active = set()
+    # Allow a minute's worth of requests in a burst
+    burst = max(args.budget / 60, 1)
+    tokens = burst
+    last_refill = last_flush = time.time()
+    next_listing = 0.0
+    dirty = False
+
+    def flush():
+        nonlocal dirty, last_flush
+        issues.commit()
+        save_state(state_path, state)
+        dirty, last_flush = False, time.time()
+
+    try:
+        while True:
+            now = time.time()
+            tokens = min(burst, tokens + (now - last_refill) * args.budget / 3600)
+            last_refill = now
+
+            if now >= next_listing and tokens >= 1:
+                before = client.requests_sent
+                next_listing = now + LISTING_INTERVAL
+                try:
+                    starred = client.get_starred_repos()
+                except Exception as e:
+                    # Keep polling the repos from the last listing until the
+                    # next one
+                    logging.error(f"Failed to list starred repos: {str(e)}")
+                    continue
+                finally:
+                    tokens -= client.requests_sent - before
+                repos = plan_repos(starred, args.days, args.skip_inactive)
+                planned = set(repos)
+                dirty = dirty or not planned.issuperset(state)
+                dirty = drop_repos(issues, state, planned) > 0 or dirty
+                # Unstarred repos are left in the queue until they come up
+                queued = active & planned
+                active = planned
+                for repo in repos:
+                    if repo not in queued:
+                        heapq.heappush(queue, (now, repo))
                 continue
-            all_issues.append(
-                {
-                    "Repository": repo_full_name,
-                    "Issue URL": issue["html_url"],
-                    "Issue Title": issue["title"],
-                    "Issue Body": issue["body"],
-                    "Created At": issue["created_at"],
-                    "Updated At": issue["updated_at"],
-                    "Labels": ", ".join(label["name"] for label in issue["labels"]),
-                    "Comments": issue["comments"],
-                    "Total Reactions": issue["reactions"]["total_count"],
-                }
+
+            if dirty and now - last_flush >= args.flush_interval:
+                flush()
+
+            due = queue[0][0] if queue else next_listing
+            if tokens < 1:
+                due = max(due, now + (1 - tokens) * 3600 / args.budget)
+            if due > now:
+                if next_listing > now:
+                    due = min(due, next_listing)
+                # Changes are written out on time even when nothing is due
+                if dirty:
+                    due = min(due, last_flush + args.flush_interval)
+                time.sleep(due - now)
+                continue
+
+            _, repo = heapq.heappop(queue)
+            if repo not in active:
+                continue
+            before = client.requests_sent
+            result = fetch_repo(
+                repo, get_issue_updates, args.max_issues, args.days, state.get(repo)
             )
-            if len(all_issues) >= max_issues:
-                break
-        url = (
-            get_next_page_link(response.headers.get("Link", ""))
-            if len(all_issues) < max_issues
-            else None
-        )
-    return all_issues
+            tokens -= client.requests_sent - before
+            now = time.time()
+
+            changes = 0
+            if result is not None:
+                # Issues at the old watermark aren't returned again, so all of
+                # these are real changes
+                updated, removed, watermark = result
+                if watermark is None and updated:
+                    watermark = max(row["Updated At"] for row in updated)
+                # The first poll covers the whole --days window. Filtered out
+                # rows still count towards the repo's activity
+                changes = len(updated) + len(removed)
+                if args.help_wanted:
+                    updated, rejected = split_wanted(updated, args)
+                    removed = removed + rejected
+                issues.upsert(updated)
+                num_removed = issues.delete(removed)
+                # Only write the output when the dataset or its state changed
+                dirty = dirty or bool(updated) or num_removed > 0
+                if watermark is not None and watermark != state.get(repo):
+                    state[repo] = watermark
+                    dirty = True
+
+            hours = (now - last_polls.get(repo, now - args.days * 86400)) / 3600
+            observed = changes / max(hours, 1 / 60)
+            rates[repo] = (
+                RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * rates[repo]
+                if repo in rates
+                else observed
+            )
+            last_polls[repo] = now
+            interval = 3600 / rates[repo] if rates[repo] > 0 else max_interval
+            interval = min(max(interval, min_interval), max_interval)
+            heapq.heappush(queue, (now + interval, repo))
+            if changes:
+                logging.info(
+                    f"{repo}: {changes} changes, next poll in {interval / 60:.0f} min"
+                )
+    except KeyboardInterrupt:
+        logging.info("Stopping")
+    finally:
+        if dirty:
+            flush()
+        issues.close()
 
 
 def main():
@@ -112,37 +843,135 @@ def main():
     parser.add_argument(
         "--encoding", type=str, default = "utf8", help="The encoding of the CSV file"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of repos to fetch issues for at the same time",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read or update the on-disk HTTP response cache",
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help="HTTP cache directory"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=256, help="Max HTTP cache size in MB"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch issues updated since the last run and upsert them into --output",
+    )
+    parser.add_argument(
+        "--state",
+        type=str,
+        help="Incremental sync state file (default: <output>.state.json)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["rest", "graphql", "search"],
+        default="rest",
+        help=(
+            "Fetch issues per repo over REST, for many repos per GraphQL query, "
+            "or only issues with --label through the Search API"
+        ),
+    )
+    parser.add_argument(
+        "--label",
+        type=str,
+        action="append",
+        help="Label to pull with --engine search; can be repeated",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=25,
+        help="Repos per GraphQL query with --engine graphql",
+    )
+    parser.add_argument(
+        "--skip-inactive",
+        action="store_true",
+        help="Skip repos with no push or metadata update in the last X days",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted pull from its last completed repo",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and poll each repo as often as its issues change",
+    )
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=1000,
+        help="Max API requests per hour in --daemon mode",
+    )
+    parser.add_argument(
+        "--min-interval",
+        type=float,
+        default=5,
+        help="Minutes between polls of the busiest repos in --daemon mode",
+    )
+    parser.add_argument(
+        "--max-interval",
+        type=float,
+        default=24,
+        help="Hours between polls of dormant repos in --daemon mode",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=int,
+        default=60,
+        help="Seconds between writes of --output in --daemon mode",
+    )
+    parser.add_argument(
+        "--help-wanted",
+        action="store_true",
+        help="Only keep issues open to contributors, like get_help_wanted.py",
+    )
+    parser.add_argument(
+        "--good-first-issue",
+        action="store_true",
+        help="With --help-wanted, only keep good first issues",
+    )
+    parser.add_argument(
+        "--accepting-prs",
+        action="store_true",
+        help="With --help-wanted, only keep issues accepting PRs",
+    )
     args = parser.parse_args()
+    # Either narrowing flag implies the filter
+    args.help_wanted = args.help_wanted or args.good_first_issue or args.accepting_prs
+    if args.engine == "search" and not args.label:
+        parser.error("--engine search needs at least one --label")
+    if (args.incremental or args.daemon) and args.engine != "rest":
+        parser.error("--incremental and --daemon only work with --engine rest")
+    if (args.incremental or args.daemon) and args.resume:
+        parser.error("--resume can't be combined with --incremental or --daemon")
 
-    repos = get_starred_repos()
-    all_issues = []
+    if not args.no_cache:
+        client.cache = ResponseCache(args.cache_dir, args.cache_size << 20)
 
-    for repo in repos:
-        try:
-            logging.info(f"Processing {repo}")
-            all_issues.extend(get_issues(repo, args.max_issues, args.days))
-        except Exception as e:
-            logging.error(f"Failed to process repo {repo}: {str(e)}")
-            continue
+    if args.daemon:
+        run_daemon(args)
+        return
 
-        # Write issues to CSV file after each repo
-        with open(args.output, "w", newline="", encoding = args.encoding) as f:
-            writer = csv.DictWriter(
-                f,
-                fieldnames=[
-                    "Repository",
-                    "Issue URL",
-                    "Issue Title",
-                    "Issue Body",
-                    "Created At",
-                    "Updated At",
-                    "Labels",
-                    "Comments",
-                    "Total Reactions",
-                ],
-            )
-            writer.writeheader()
-            writer.writerows(all_issues)
+    with (ThreadPoolExecutor(max_workers=LISTING_WORKERS) as lister,
+          ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor):
+        # Pages of starred repos are listed concurrently, in a pool of their
+        # own so --concurrency doesn't throttle them, and their issues are
+        # fetched as soon as each page arrives
+        pages = client.starred_repo_pages(lister)
+        if args.incremental:
+            sync_incremental(executor, pages, args)
+        else:
+            pull_all(executor, pages, args)
 
 
 if __name__ == "__main__":
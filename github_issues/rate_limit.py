@@ -0,0 +1,165 @@
+"""
+Rate limit aware scheduling of GitHub API requests over a pool of tokens.
+
+Every response's `X-RateLimit-Remaining` / `X-RateLimit-Reset` headers are
+tracked per token and per rate limit resource (core, search, graphql, ...).
+Requests go to the token with the most headroom, are paced evenly over the
+rest of the window once a token runs low, and are retried after the right
+delay when GitHub answers with a primary or secondary rate limit error.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+# Below this many remaining requests a token is paced instead of drained
+PACING_THRESHOLD = 100
+
+# GitHub asks to wait at least a minute on secondary limits without Retry-After
+SECONDARY_LIMIT_DELAY = 60
+
+
+def load_tokens(name: str = "API_TOKEN") -> List[str]:
+    """
+    Read `name`, `name_2`, `name_3`, ... from the environment.
+    """
+    tokens = []
+    token = os.getenv(name)
+    i = 2
+    while token:
+        tokens.append(token)
+        token = os.getenv(f"{name}_{i}")
+        i += 1
+    return tokens
+
+
+def resource_for(url: str) -> str:
+    # Best guess before a response tells us the actual X-RateLimit-Resource
+    if "/search/" in url:
+        return "search"
+    if url.endswith("/graphql"):
+        return "graphql"
+    return "core"
+
+
+class Budget:
+    def __init__(self):
+        self.remaining: Optional[int] = None
+        self.reset = 0.0
+        self.next_request = 0.0
+
+
+class RateLimitScheduler:
+    """
+    Thread-safe; one instance should be shared by everything that talks to
+    the API so all requests draw from the same budgets.
+    """
+
+    def __init__(
+        self,
+        tokens: List[str],
+        session: Optional[requests.Session] = None,
+        max_retries: int = 5,
+    ):
+        # Authorization header values; "" sends requests anonymously
+        self.pool = [f"token {token}" for token in tokens] or [""]
+        self.http = session or requests
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.budgets: Dict[Tuple[str, str], Budget] = {}
+        self.blocked_until: Dict[str, float] = {}
+
+    def budget(self, auth: str, resource: str) -> Budget:
+        key = (auth, resource)
+        if key not in self.budgets:
+            self.budgets[key] = Budget()
+        return self.budgets[key]
+
+    def ready_at(self, auth: str, resource: str, now: float) -> float:
+        budget = self.budget(auth, resource)
+        ready = max(self.blocked_until.get(auth, 0.0), budget.next_request)
+        if budget.remaining is not None and budget.remaining <= 0 and budget.reset > now:
+            ready = max(ready, budget.reset)
+        return ready
+
+    def acquire(self, resource: str, auth: Optional[str] = None) -> str:
+        candidates = [auth] if auth is not None else self.pool
+        while True:
+            with self.lock:
+                now = time.time()
+                auth, ready = min(
+                    ((candidate, self.ready_at(candidate, resource, now)) for candidate in candidates),
+                    key=lambda item: (item[1], -(self.budget(item[0], resource).remaining or 0)),
+                )
+                if ready <= now:
+                    budget = self.budget(auth, resource)
+                    if budget.remaining is not None:
+                        budget.remaining -= 1
+                        if budget.remaining < PACING_THRESHOLD and budget.reset > now:
+                            # Spread what is left evenly over the rest of the window
+                            spacing = (budget.reset - now) / max(budget.remaining, 1)
+                            budget.next_request = now + spacing
+                    return auth
+            delay = ready - now
+            if delay > 5:
+                logging.warning(f"Rate limit reached, waiting {delay:.0f}s")
+            time.sleep(delay)
+
+    def update(self, auth: str, resource: str, response: requests.Response) -> Optional[float]:
+        """
+        Record the rate limit headers of a response.
+
+        Returns the delay before retrying if the request was rate limited.
+        """
+        now = time.time()
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        resource = response.headers.get("X-RateLimit-Resource", resource)
+        with self.lock:
+            budget = self.budget(auth, resource)
+            if remaining is not None and reset is not None:
+                budget.remaining = int(remaining)
+                budget.reset = float(reset)
+
+            if response.status_code not in (403, 429):
+                return None
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                delay = float(retry_after)
+            elif remaining == "0" and reset is not None:
+                delay = max(float(reset) - now, 0.0) + 1
+            elif "secondary rate limit" in response.text.lower():
+                delay = SECONDARY_LIMIT_DELAY
+            else:
+                # An ordinary permission error
+                return None
+            self.blocked_until[auth] = max(self.blocked_until.get(auth, 0.0), now + delay)
+            return delay
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the pool.
+
+        A request that already carries an Authorization header is pinned to
+        that token, e.g. for /user endpoints that depend on who is asking.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        pinned = headers.pop("Authorization", None)
+        resource = resource_for(url)
+        for attempt in range(self.max_retries + 1):
+            auth = self.acquire(resource, pinned)
+            if auth:
+                headers["Authorization"] = auth
+            response = self.http.request(method, url, headers=headers, **kwargs)
+            delay = self.update(auth, resource, response)
+            if delay is None or attempt == self.max_retries:
+                return response
+            logging.warning(f"Rate limited on {url} for {delay:.0f}s, retrying")
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
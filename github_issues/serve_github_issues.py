@@ -1,24 +1,114 @@
 """
-Server to display GitHub issues from a provided CSV file.
+Server to display GitHub issues from a provided CSV file or issue store.
 
 Author: GPT-4
 
+The issue list is paginated with ?page=&per_page=, and the same pages are
+available as JSON from /issues.json. /search?q= searches issue titles,
+bodies and labels. Both can be narrowed down with ?repo=, ?label= and
+?exclude_label=.
+
 Usage:
-  python serve_github_issues.py <input.csv> --port <port>
+  python serve_github_issues.py <input.csv> --port <port> [--render-cache <cache.json>] [--render-cache-size <n>]
 """
 
 import argparse
-from datetime import datetime
+from array import array
+import atexit
+import collections
 import csv
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import os
 import random
 import sys
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlencode
 from marko import Markdown
 from marko.ext.gfm import GFM
-from flask import Flask, request, render_template_string, Markup
-from werkzeug.exceptions import NotFound
-
-markdown = Markdown(extensions=["codehilite"])
-markdown.use(GFM)
+from flask import Flask, Response, jsonify, request, Markup
+from werkzeug.exceptions import NotFound, ServiceUnavailable
+from compression import open_text
+from issue_dataset import IssueDataset
+from issue_facets import FacetIndex, bit_string, to_bitset
+from issue_search import SearchIndex
+from merge_issue_csvs import iter_issues
+
+
+def make_markdown() -> Markdown:
+    markdown = Markdown(extensions=["codehilite"])
+    markdown.use(GFM)
+    return markdown
+
+
+class RenderCache:
+    """
+    LRU cache of rendered issue bodies, keyed by issue URL and a hash of the
+    body so an edited issue is rendered again.
+
+    A marko `Markdown` keeps parser state while rendering, so every thread
+    renders with its own instance.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @staticmethod
+    def key(issue: Dict[str, str]) -> str:
+        digest = hashlib.sha256(issue["Issue Body"].encode()).hexdigest()
+        return f"{issue['Issue URL']} {digest}"
+
+    def render(self, issue: Dict[str, str]) -> str:
+        key = self.key(issue)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if not hasattr(self.local, "markdown"):
+            self.local.markdown = make_markdown()
+        html = self.local.markdown(issue["Issue Body"])
+        with self.lock:
+            self.entries[key] = html
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return html
+
+    def prerender(self, issues: Iterable[Dict[str, str]]) -> None:
+        # Only as many as fit, so pre-rendering doesn't evict its own work
+        count = 0
+        for issue in itertools.islice(issues, self.max_entries):
+            self.render(issue)
+            count += 1
+        logging.info(f"Pre-rendered {count} issues")
+
+    def load(self, path: str, issues: Iterable[Dict[str, str]]) -> None:
+        if not os.path.exists(path):
+            return
+        with open_text(path, "r", encoding="utf8") as f:
+            saved = json.load(f)
+        # Entries for issues that are gone or were edited since are dropped
+        current = {self.key(issue) for issue in issues}
+        with self.lock:
+            for key, html in saved.items():
+                if key in current:
+                    self.entries[key] = html
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self, path: str) -> None:
+        with self.lock:
+            entries = dict(self.entries)
+        with open_text(f"{path}.tmp", "w", encoding="utf8", like=path) as f:
+            json.dump(entries, f)
+        os.replace(f"{path}.tmp", path)
 
 # Increase CSV field size limit
 maxInt = sys.maxsize
@@ -31,7 +121,9 @@ while True:
 
 # Read arguments
 parser = argparse.ArgumentParser()
-parser.add_argument("csvfile", type=str, help="Input CSV file")
+parser.add_argument(
+    "csvfile", type=str, help="Input CSV file, or issue store (.db, see issue_store.py)"
+)
 parser.add_argument(
     "--port", type=int, default=5000, help="Port number to run the server on"
 )
@@ -39,409 +131,746 @@ parser.add_argument(
 parser.add_argument(
     "--encoding", type=str, default = "utf8", help="The encoding of the CSV file"
 )
+parser.add_argument(
+    "--render-cache",
+    type=str,
+    help="File to keep rendered issue bodies in across restarts",
+)
+parser.add_argument(
+    "--render-cache-size",
+    type=int,
+    default=4096,
+    help="Max number of rendered issue bodies to keep in memory",
+)
 args = parser.parse_args()
 
-# Load issues from CSV
-issues = []
-with open(args.csvfile, "r", encoding = args.encoding) as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        # Format the dates in a more human-readable way
-        row["Created At"] = datetime.strptime(
-            row["Created At"], "%Y-%m-%dT%H:%M:%SZ"
-        ).strftime("%b %d, %Y %H:%M:%S")
-        row["Updated At"] = datetime.strptime(
-            row["Updated At"], "%Y-%m-%dT%H:%M:%SZ"
-        ).strftime("%b %d, %Y %H:%M:%S")
-        issues.append(row)
-
-SORTED_ISSUES = {
-    "created_at": sorted(
-        issues,
-        key=lambda x: datetime.strptime(x["Created At"], "%b %d, %Y %H:%M:%S"),
-        reverse=True,
-    ),
-    "updated_at": sorted(
-        issues,
-        key=lambda x: datetime.strptime(x["Updated At"], "%b %d, %Y %H:%M:%S"),
-        reverse=True,
-    ),
-    "total_reactions": sorted(
-        issues, key=lambda x: int(x["Total Reactions"]), reverse=True
-    ),
-    "repo_name": sorted(issues, key=lambda x: x["Repository"]),
-    "comments": sorted(issues, key=lambda x: int(x["Comments"]), reverse=True),
+# Load issues from CSV or issue store
+dataset = IssueDataset(iter_issues(args.csvfile, args.encoding))
+facets = FacetIndex(dataset)
+
+# Built in the background at startup, see build_search_index()
+search_index: Optional[SearchIndex] = None
+
+render_cache = RenderCache(args.render_cache_size)
+
+# Issues per page of the listing, unless ?per_page= says otherwise
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 1000
+
+# Cards and issue headers are rendered once and reused, up to this many each
+FRAGMENT_CACHE_SIZE = 1 << 14
+
+# Query parameters narrowing the listing; each can be given several times
+FILTERS = ("repo", "label", "exclude_label")
+
+# Facet values listed per facet on the listing pages and in /issues.json
+FACET_LIMIT = 15
+
+STYLESHEETS = {
+    "list": """
+body {
+  font-family: Arial, sans-serif;
+  margin: 0;
+  padding: 1em;
 }
 
-# Initialize Flask app
-app = Flask(__name__)
+.sort-bar {
+  background-color: #f2f2f2;
+  padding: 0.5em;
+  position: sticky;
+  top: 0;
+  z-index: 1;
+}
 
+.sort-bar a {
+  margin-right: 1em;
+  text-decoration: none;
+  color: #007BFF;
+}
 
-@app.route("/")
-def homepage():
-    sort = request.args.get("sort", default="created_at", type=str)
-    return render_template_string(
-        """
-    <!doctype html>
-    <html>
-    <head>
-      <title>GitHub Issues</title>
-      <style>
-        body {
-          font-family: Arial, sans-serif;
-          margin: 0;
-          padding: 1em;
-        }
-    
-        .sort-bar {
-          background-color: #f2f2f2;
-          padding: 0.5em;
-          position: sticky;
-          top: 0;
-          z-index: 1;
-        }
-    
-        .sort-bar a {
-          margin-right: 1em;
-          text-decoration: none;
-          color: #007BFF;
-        }
-    
-        .sort-bar a:not(:last-child)::after {
-          content: '|';
-          margin-left: 1em;
-          color: #bbb;
-        }
-    
-        .container {
-          display: grid;
-          grid-template-columns: repeat(auto-fit, minmax(400px, 1fr));
-          gap: 1em;
-        }
-    
-        .card {
-          border: 1px solid #ddd;
-          border-radius: 5px;
-          padding: 1em;
-          display: flex;
-          flex-direction: column;
-          justify-content: space-between;
-        }
-    
-        .card h2 {
-          margin-top: 0;
-          margin-bottom: 0.5em;
-          font-size: 1.2em;
-        }
-    
-        .card p {
-          margin: 0;
-          margin-bottom: 0.2em;
-          line-height: 1.2;
-        }
-    
-        .card .tags {
-          display: flex;
-          flex-wrap: wrap;
-          margin-top: 0.5em;
-        }
-    
-        .card .tag {
-          background-color: #eee;
-          border-radius: 3px;
-          padding: 0.3em 0.6em;
-          margin-right: 0.6em;
-          margin-bottom: 0.6em;
-          font-size: 0.85em;
-        }
-    
-        .empty-message {
-          text-align: center;
-          font-size: 1.2em;
-          color: #888;
-          margin: 2em;
-        }
-    
-        a {
-          color: #007BFF;
-          text-decoration: none;
-        }
-    
-        a:hover {
-          text-decoration: underline;
-        }
-      </style>
-    </head>
-    <body>
-      <div class="sort-bar">
-        <span>Sort by:</span>
-        <a href="/?sort=repo_name">Repository Name</a>
-        <a href="/?sort=created_at">Created At</a>
-        <a href="/?sort=updated_at">Updated At</a>
-        <a href="/?sort=total_reactions">Total Reactions</a>
-        <a href="/?sort=comments">Comments</a>
+.sort-bar a:not(:last-of-type)::after {
+  content: '|';
+  margin-left: 1em;
+  color: #bbb;
+}
+
+.sort-bar form {
+  display: inline;
+  float: right;
+}
+
+.facets {
+  margin: 0.5em 0 1em;
+  font-size: 0.9em;
+}
+
+.facet {
+  margin-bottom: 0.3em;
+}
+
+.facet a {
+  margin-left: 0.6em;
+}
+
+.facet a.exclude {
+  margin-left: 0.2em;
+  color: #bbb;
+}
+
+.container {
+  display: grid;
+  grid-template-columns: repeat(auto-fit, minmax(400px, 1fr));
+  gap: 1em;
+}
+
+.card {
+  border: 1px solid #ddd;
+  border-radius: 5px;
+  padding: 1em;
+  display: flex;
+  flex-direction: column;
+  justify-content: space-between;
+}
+
+.card h2 {
+  margin-top: 0;
+  margin-bottom: 0.5em;
+  font-size: 1.2em;
+}
+
+.card p {
+  margin: 0;
+  margin-bottom: 0.2em;
+  line-height: 1.2;
+}
+
+.card .tags {
+  display: flex;
+  flex-wrap: wrap;
+  margin-top: 0.5em;
+}
+
+.card .tag {
+  background-color: #eee;
+  border-radius: 3px;
+  padding: 0.3em 0.6em;
+  margin-right: 0.6em;
+  margin-bottom: 0.6em;
+  font-size: 0.85em;
+}
+
+.empty-message {
+  text-align: center;
+  font-size: 1.2em;
+  color: #888;
+  margin: 2em;
+}
+
+.pagination {
+  text-align: center;
+  margin: 1em;
+}
+
+.pagination a, .pagination span {
+  margin: 0 1em;
+}
+
+a {
+  color: #007BFF;
+  text-decoration: none;
+}
+
+a:hover {
+  text-decoration: underline;
+}
+""",
+    "issue": """
+body {
+  font-family: Arial, sans-serif;
+  margin: 0;
+  padding: 1em;
+}
+
+.navbar {
+  background-color: #f2f2f2;
+  padding: 0.5em;
+  position: sticky;
+  top: 0;
+  z-index: 1;
+  max-width: 800px;
+  margin: 0 auto;
+}
+
+.navbar a {
+  margin-right: 1em;
+  text-decoration: none;
+  color: #007BFF;
+}
+
+.navbar a:not(:last-child)::after {
+  content: '|';
+  margin-left: 1em;
+  color: #bbb;
+}
+
+.container {
+  max-width: 800px;
+  margin: 0 auto;
+}
+
+h1 {
+  color: #333;
+  font-size: 1.8em;
+  margin-top: 0;
+  margin-bottom: 0.5em;
+}
+
+p {
+  margin: 0;
+  margin-bottom: 0.2em;
+  line-height: 1.4;
+}
+
+.metadata {
+  margin-top: 1em;
+}
+
+.metadata p {
+  font-size: 0.9em;
+}
+
+.labels {
+  margin-top: 1em;
+}
+
+.label {
+  display: inline-block;
+  background-color: #eee;
+  border-radius: 3px;
+  padding: 0.3em 0.6em;
+  margin-right: 0.6em;
+  margin-bottom: 0.6em;
+  font-size: 0.85em;
+}
+
+.issue-body {
+  margin-top: 1em;
+}
+
+a {
+  color: #007BFF;
+  text-decoration: none;
+}
+
+a:hover {
+  text-decoration: underline;
+}
+
+pre { line-height: 125%; padding: 16px; }
+td.linenos .normal { color: inherit; background-color: transparent; padding-left: 5px; padding-right: 5px; }
+span.linenos { color: inherit; background-color: transparent; padding-left: 5px; padding-right: 5px; }
+td.linenos .special { color: #000000; background-color: #ffffc0; padding-left: 5px; padding-right: 5px; }
+span.linenos.special { color: #000000; background-color: #ffffc0; padding-left: 5px; padding-right: 5px; }
+.highlight .hll { background-color: #ffffcc }
+.highlight { background: #f8f8f8; }
+.highlight .c { color: #3D7B7B; font-style: italic } /* Comment */
+.highlight .err { border: 1px solid #FF0000 } /* Error */
+.highlight .k { color: #008000; font-weight: bold } /* Keyword */
+.highlight .o { color: #666666 } /* Operator */
+.highlight .ch { color: #3D7B7B; font-style: italic } /* Comment.Hashbang */
+.highlight .cm { color: #3D7B7B; font-style: italic } /* Comment.Multiline */
+.highlight .cp { color: #9C6500 } /* Comment.Preproc */
+.highlight .cpf { color: #3D7B7B; font-style: italic } /* Comment.PreprocFile */
+.highlight .c1 { color: #3D7B7B; font-style: italic } /* Comment.Single */
+.highlight .cs { color: #3D7B7B; font-style: italic } /* Comment.Special */
+.highlight .gd { color: #A00000 } /* Generic.Deleted */
+.highlight .ge { font-style: italic } /* Generic.Emph */
+.highlight .gr { color: #E40000 } /* Generic.Error */
+.highlight .gh { color: #000080; font-weight: bold } /* Generic.Heading */
+.highlight .gi { color: #008400 } /* Generic.Inserted */
+.highlight .go { color: #717171 } /* Generic.Output */
+.highlight .gp { color: #000080; font-weight: bold } /* Generic.Prompt */
+.highlight .gs { font-weight: bold } /* Generic.Strong */
+.highlight .gu { color: #800080; font-weight: bold } /* Generic.Subheading */
+.highlight .gt { color: #0044DD } /* Generic.Traceback */
+.highlight .kc { color: #008000; font-weight: bold } /* Keyword.Constant */
+.highlight .kd { color: #008000; font-weight: bold } /* Keyword.Declaration */
+.highlight .kn { color: #008000; font-weight: bold } /* Keyword.Namespace */
+.highlight .kp { color: #008000 } /* Keyword.Pseudo */
+.highlight .kr { color: #008000; font-weight: bold } /* Keyword.Reserved */
+.highlight .kt { color: #B00040 } /* Keyword.Type */
+.highlight .m { color: #666666 } /* Literal.Number */
+.highlight .s { color: #BA2121 } /* Literal.String */
+.highlight .na { color: #687822 } /* Name.Attribute */
+.highlight .nb { color: #008000 } /* Name.Builtin */
+.highlight .nc { color: #0000FF; font-weight: bold } /* Name.Class */
+.highlight .no { color: #880000 } /* Name.Constant */
+.highlight .nd { color: #AA22FF } /* Name.Decorator */
+.highlight .ni { color: #717171; font-weight: bold } /* Name.Entity */
+.highlight .ne { color: #CB3F38; font-weight: bold } /* Name.Exception */
+.highlight .nf { color: #0000FF } /* Name.Function */
+.highlight .nl { color: #767600 } /* Name.Label */
+.highlight .nn { color: #0000FF; font-weight: bold } /* Name.Namespace */
+.highlight .nt { color: #008000; font-weight: bold } /* Name.Tag */
+.highlight .nv { color: #19177C } /* Name.Variable */
+.highlight .ow { color: #AA22FF; font-weight: bold } /* Operator.Word */
+.highlight .w { color: #bbbbbb } /* Text.Whitespace */
+.highlight .mb { color: #666666 } /* Literal.Number.Bin */
+.highlight .mf { color: #666666 } /* Literal.Number.Float */
+.highlight .mh { color: #666666 } /* Literal.Number.Hex */
+.highlight .mi { color: #666666 } /* Literal.Number.Integer */
+.highlight .mo { color: #666666 } /* Literal.Number.Oct */
+.highlight .sa { color: #BA2121 } /* Literal.String.Affix */
+.highlight .sb { color: #BA2121 } /* Literal.String.Backtick */
+.highlight .sc { color: #BA2121 } /* Literal.String.Char */
+.highlight .dl { color: #BA2121 } /* Literal.String.Delimiter */
+.highlight .sd { color: #BA2121; font-style: italic } /* Literal.String.Doc */
+.highlight .s2 { color: #BA2121 } /* Literal.String.Double */
+.highlight .se { color: #AA5D1F; font-weight: bold } /* Literal.String.Escape */
+.highlight .sh { color: #BA2121 } /* Literal.String.Heredoc */
+.highlight .si { color: #A45A77; font-weight: bold } /* Literal.String.Interpol */
+.highlight .sx { color: #008000 } /* Literal.String.Other */
+.highlight .sr { color: #A45A77 } /* Literal.String.Regex */
+.highlight .s1 { color: #BA2121 } /* Literal.String.Single */
+.highlight .ss { color: #19177C } /* Literal.String.Symbol */
+.highlight .bp { color: #008000 } /* Name.Builtin.Pseudo */
+.highlight .fm { color: #0000FF } /* Name.Function.Magic */
+.highlight .vc { color: #19177C } /* Name.Variable.Class */
+.highlight .vg { color: #19177C } /* Name.Variable.Global */
+.highlight .vi { color: #19177C } /* Name.Variable.Instance */
+.highlight .vm { color: #19177C } /* Name.Variable.Magic */
+.highlight .il { color: #666666 } /* Literal.Number.Integer.Long */
+""",
+}
+
+# Pages link to /css/<name>.css?v=<hash>, so browsers can cache stylesheets
+# forever and still pick up changes
+STYLESHEET_HASHES = {
+    name: hashlib.sha256(css.encode()).hexdigest()[:16]
+    for name, css in STYLESHEETS.items()
+}
+
+LIST_TEMPLATE = """<!doctype html>
+<html>
+<head>
+  <title>{% if q is none %}GitHub Issues{% else %}Search: {{ q }}{% endif %}</title>
+  <link rel="stylesheet" href="/css/list.css?v={{ css_hash }}">
+</head>
+<body>
+  <div class="sort-bar">
+    <span>Sort by:</span>
+    {% if q is not none %}
+      <a href="{{ base }}sort=relevance&per_page={{ per_page }}">Relevance</a>
+    {% endif %}
+    <a href="{{ base }}sort=repo_name&per_page={{ per_page }}">Repository Name</a>
+    <a href="{{ base }}sort=created_at&per_page={{ per_page }}">Created At</a>
+    <a href="{{ base }}sort=updated_at&per_page={{ per_page }}">Updated At</a>
+    <a href="{{ base }}sort=total_reactions&per_page={{ per_page }}">Total Reactions</a>
+    <a href="{{ base }}sort=comments&per_page={{ per_page }}">Comments</a>
+    <form action="/search">
+      <input type="search" name="q" value="{{ q or '' }}" placeholder="Search, e.g. tokio async*">
+    </form>
+  </div>
+  <div class="facets">
+    {% if active %}
+      <div class="facet">
+        <strong>Filters:</strong>
+        {% for name, href in active %}<a href="{{ href }}" title="Remove">{{ name }} &times;</a>{% endfor %}
       </div>
-      <div class="container">
-        {% for issue in issues %}
-          <div class="card">
-            <h2>
-              <a href="/{{ loop.index }}?sort={{ sort }}">
-                {{ issue['Issue Title'] }}
-              </a>
-            </h2>
-            <p>
-              <a href="{{ issue['Issue URL'] }}" target="_blank" rel="noopener noreferrer">
-                <strong>Comments:</strong> {{ issue['Comments'] }}
-              </a>
-            </p>
-            <p><strong>Repository:</strong> {{ issue['Repository'] }}</p>
-            <p><strong>Created at:</strong> {{ issue['Created At'] }}</p>
-            <p><strong>Updated at:</strong> {{ issue['Updated At'] }}</p>
-            <p><strong>Total reactions:</strong> {{ issue['Total Reactions'] }}</p>
-            {% if issue['Labels'] %}
-              <div class="tags">
-                {% for label in issue['Labels'].split(', ') %}
-                  <span class="tag">{{ label }}</span>
-                {% endfor %}
-              </div>
-            {% endif %}
-          </div>
+    {% endif %}
+    {% for title, entries in facet_links %}
+      <div class="facet">
+        <strong>{{ title }}:</strong>
+        {% for entry in entries %}<a href="{{ entry.href }}">{{ entry.name }} ({{ entry.count }})</a>{% if entry.exclude_href %}<a class="exclude" href="{{ entry.exclude_href }}" title="Exclude">&minus;</a>{% endif %}{% endfor %}
+      </div>
+    {% endfor %}
+  </div>
+  <div class="container">
+    {% for card in cards %}{{ card }}{% endfor %}
+    {% if not cards %}
+      <p class="empty-message">No issues found.</p>
+    {% endif %}
+  </div>
+  {% if num_pages > 1 %}
+    <div class="pagination">
+      {% if page > 1 %}
+        <a href="{{ base }}sort={{ sort }}&page={{ page - 1 }}&per_page={{ per_page }}">Previous</a>
+      {% endif %}
+      <span>Page {{ page }} of {{ num_pages }}</span>
+      {% if page < num_pages %}
+        <a href="{{ base }}sort={{ sort }}&page={{ page + 1 }}&per_page={{ per_page }}">Next</a>
+      {% endif %}
+    </div>
+  {% endif %}
+</body>
+</html>
+"""
+
+CARD_TEMPLATE = """
+    <div class="card">
+      <h2>
+        <a href="/{{ issue_num }}?sort={{ sort }}">
+          {{ issue['Issue Title'] }}
+        </a>
+      </h2>
+      <p>
+        <a href="{{ issue['Issue URL'] }}" target="_blank" rel="noopener noreferrer">
+          <strong>Comments:</strong> {{ issue['Comments'] }}
+        </a>
+      </p>
+      <p><strong>Repository:</strong> {{ issue['Repository'] }}</p>
+      <p><strong>Created at:</strong> {{ issue['Created At'] }}</p>
+      <p><strong>Updated at:</strong> {{ issue['Updated At'] }}</p>
+      <p><strong>Total reactions:</strong> {{ issue['Total Reactions'] }}</p>
+      {% if issue['Labels'] %}
+        <div class="tags">
+          {% for label in issue['Labels'].split(', ') %}
+            <span class="tag">{{ label }}</span>
+          {% endfor %}
+        </div>
+      {% endif %}
+    </div>"""
+
+ISSUE_TEMPLATE = """<!doctype html>
+<html>
+<head>
+  <title>Issue {{ issue_num }}</title>
+  <link rel="stylesheet" href="/css/issue.css?v={{ css_hash }}">
+</head>
+<body>
+  <div class="navbar">
+    <a href="/">Home</a>
+    <a href="/1?sort={{ sort }}">First</a>
+    <a href="/{{ prev_issue_num }}?sort={{ sort }}">Previous</a>
+    <a href="/{{ random_issue_num }}?sort={{ sort }}">Random</a>
+    <a href="/{{ next_issue_num }}?sort={{ sort }}">Next</a>
+    <a href="/{{ num_issues }}?sort={{ sort }}">Last</a>
+  </div>
+  <div class="container">{{ header }}
+    <div class="issue-body">{{ issue_body_html }}</div>
+  </div>
+</body>
+</html>
+"""
+
+ISSUE_HEADER_TEMPLATE = """
+    <h1><a href="{{ issue['Issue URL'] }}" target="_blank" rel="noopener noreferrer">{{ issue['Issue Title'] }}</a></h1>
+    <div class="metadata">
+      <p>
+        <a href="{{ issue['Issue URL'] }}" target="_blank" rel="noopener noreferrer">
+          <strong>Comments:</strong> {{ issue['Comments'] }}
+        </a>
+      </p>
+      <p><strong>Repository:</strong> {{ issue['Repository'] }}</p>
+      <p><strong>Created at:</strong> {{ issue['Created At'] }}</p>
+      <p><strong>Updated at:</strong> {{ issue['Updated At'] }}</p>
+      <p><strong>Total reactions:</strong> {{ issue['Total Reactions'] }}</p>
+    </div>
+    {% if issue['Labels'] %}
+      <div class="labels">
+        {% for label in issue['Labels'].split(', ') %}
+          <span class="label">{{ label }}</span>
         {% endfor %}
-        {% if not issues %}
-          <p class="empty-message">No issues found.</p>
-        {% endif %}
       </div>
-    </body>
-    </html>
-    """,
-        issues=SORTED_ISSUES[sort],
-        sort=sort,
-    )
+    {% endif %}"""
 
+# Initialize Flask app
+app = Flask(__name__)
 
-@app.route("/<int:issue_num>")
-def get_issue(issue_num):
-    sort = request.args.get("sort", default="created_at", type=str)
-    try:
-        issue = SORTED_ISSUES[sort][
-            issue_num - 1
-        ]  # Subtract 1 because indexing starts from 0
-    except IndexError:
-        raise NotFound("Issue not found")
+# Compiled once instead of on every request
+list_template = app.jinja_env.from_string(LIST_TEMPLATE)
+card_template = app.jinja_env.from_string(CARD_TEMPLATE)
+issue_template = app.jinja_env.from_string(ISSUE_TEMPLATE)
+issue_header_template = app.jinja_env.from_string(ISSUE_HEADER_TEMPLATE)
 
-    # Convert Markdown to HTML
-    issue_body_html = Markup(markdown(issue["Issue Body"]))
 
-    # Render issue details
-    return render_template_string(
-        """
-    <!doctype html>
-    <html>
-    <head>
-      <title>Issue {{ issue_num }}</title>
-      <style>
-        body {
-          font-family: Arial, sans-serif;
-          margin: 0;
-          padding: 1em;
-        }
+def get_issue_at(sort: str, issue_num: int) -> Dict[str, str]:
+    # Subtract 1 because indexing starts from 0
+    return dataset.row(dataset.order(sort)[issue_num - 1])
 
-        .navbar {
-          background-color: #f2f2f2;
-          padding: 0.5em;
-          position: sticky;
-          top: 0;
-          z-index: 1;
-          max-width: 800px;
-          margin: 0 auto;
-        }
 
-        .navbar a {
-          margin-right: 1em;
-          text-decoration: none;
-          color: #007BFF;
-        }
+# The issues are immutable while the server runs, so the markup of an issue
+# at a given position of a sort order never changes
+@functools.lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def render_card(sort: str, issue_num: int) -> Markup:
+    issue = get_issue_at(sort, issue_num)
+    return Markup(card_template.render(issue=issue, issue_num=issue_num, sort=sort))
 
-        .navbar a:not(:last-child)::after {
-          content: '|';
-          margin-left: 1em;
-          color: #bbb;
-        }
 
-        .container {
-          max-width: 800px;
-          margin: 0 auto;
-        }
+@functools.lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def render_issue_header(sort: str, issue_num: int) -> Markup:
+    issue = get_issue_at(sort, issue_num)
+    return Markup(issue_header_template.render(issue=issue))
 
-        h1 {
-          color: #333;
-          font-size: 1.8em;
-          margin-top: 0;
-          margin-bottom: 0.5em;
-        }
 
-        p {
-          margin: 0;
-          margin-bottom: 0.2em;
-          line-height: 1.4;
-        }
+def get_page(default_sort: str = "created_at") -> Tuple[str, int, int]:
+    sort = request.args.get("sort", default=default_sort, type=str)
+    page = max(request.args.get("page", default=1, type=int), 1)
+    per_page = request.args.get("per_page", default=DEFAULT_PER_PAGE, type=int)
+    return sort, page, min(max(per_page, 1), MAX_PER_PAGE)
 
-        .metadata {
-          margin-top: 1em;
-        }
 
-        .metadata p {
-          font-size: 0.9em;
-        }
+@app.route("/css/<name>.css")
+def stylesheet(name):
+    if name not in STYLESHEETS:
+        raise NotFound("Stylesheet not found")
+    response = Response(STYLESHEETS[name], mimetype="text/css")
+    response.set_etag(STYLESHEET_HASHES[name])
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
 
-        .labels {
-          margin-top: 1em;
-        }
 
-        .label {
-          display: inline-block;
-          background-color: #eee;
-          border-radius: 3px;
-          padding: 0.3em 0.6em;
-          margin-right: 0.6em;
-          margin-bottom: 0.6em;
-          font-size: 0.85em;
-        }
+def get_filters() -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    # Hashable, so results can be memoized per combination of filters
+    return tuple((name, tuple(request.args.getlist(name))) for name in FILTERS)
 
-        .issue-body {
-          margin-top: 1em;
-        }
 
-        a {
-          color: #007BFF;
-          text-decoration: none;
-        }
+@functools.lru_cache(maxsize=256)
+def filter_mask(filters: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> Optional[int]:
+    repos, labels, exclude_labels = (list(values) for _, values in filters)
+    if not (repos or labels or exclude_labels):
+        return None
+    return facets.mask(repos, labels, exclude_labels)
+
+
+@functools.lru_cache(maxsize=16)
+def filtered_order(
+    sort: str, filters: Tuple[Tuple[str, Tuple[str, ...]], ...]
+) -> Sequence[int]:
+    # Row indexes in sort order, narrowed down to the filters
+    mask = filter_mask(filters)
+    if mask is None:
+        return dataset.order(sort)
+    return array("l", facets.select(mask, dataset.order(sort), dataset.rank(sort)))
+
+
+def page_base(path: str, query: Optional[str], filters: Iterable) -> str:
+    """
+    The URL of the current listing with its query and filters, ready for
+    more parameters to be appended.
+    """
+    params = [("q", query)] if query is not None else []
+    params += [(name, value) for name, values in filters for value in values]
+    return f"{path}?{urlencode(params)}&" if params else f"{path}?"
+
+
+@functools.lru_cache(maxsize=256)
+def facet_counts(mask: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+    # The FACET_LIMIT most common repositories and labels among the rows in mask
+    return tuple(
+        dict(itertools.islice(counts.items(), FACET_LIMIT))
+        for counts in facets.counts(mask)
+    )
+
+
+def facet_links(
+    path: str, query: Optional[str], filters: Tuple, mask: int
+) -> Tuple[List[Tuple[str, str]], List[Tuple[str, List[dict]]]]:
+    """
+    Links removing each active filter, and the most common repositories and
+    labels among the listed issues with links narrowing down to them.
+    """
+
+    def with_filter(name: str, value: str, add: bool) -> str:
+        changed = []
+        for key, values in filters:
+            if key == name:
+                values = values + (value,) if add else tuple(v for v in values if v != value)
+            changed.append((key, values))
+        # Without the trailing "&" or "?"
+        return page_base(path, query, changed)[:-1]
+
+    active = [
+        (f"{'not ' if name == 'exclude_label' else ''}{value}", with_filter(name, value, False))
+        for name, values in filters
+        for value in values
+    ]
+    repo_counts, label_counts = facet_counts(mask)
+    links = [
+        (
+            "Repository",
+            [
+                {"name": repo, "count": count, "href": with_filter("repo", repo, True)}
+                for repo, count in repo_counts.items()
+            ],
+        ),
+        (
+            "Label",
+            [
+                {
+                    "name": label,
+                    "count": count,
+                    "href": with_filter("label", label, True),
+                    "exclude_href": with_filter("exclude_label", label, True),
+                }
+                for label, count in label_counts.items()
+            ],
+        ),
+    ]
+    return active, links
+
+
+@functools.lru_cache(maxsize=256)
+def listing_facets(path: str, query: Optional[str], filters: Tuple, mask: int):
+    return facet_links(path, query, filters, mask)
+
+
+@app.route("/")
+def homepage():
+    sort, page, per_page = get_page()
+    filters = get_filters()
+    order = filtered_order(sort, filters)  # Unknown sorts fail here
+    rank = dataset.rank(sort)
+    mask = filter_mask(filters)
+    active, links = listing_facets(
+        "/", None, filters, facets.all if mask is None else mask
+    )
+    # Only the requested page is rendered
+    offset = (page - 1) * per_page
+    return list_template.render(
+        cards=[
+            render_card(sort, rank[index] + 1)
+            for index in order[offset : offset + per_page]
+        ],
+        css_hash=STYLESHEET_HASHES["list"],
+        base=page_base("/", None, filters),
+        active=active,
+        facet_links=links,
+        q=None,
+        sort=sort,
+        page=page,
+        per_page=per_page,
+        num_pages=-(-len(order) // per_page),
+    )
 
-        a:hover {
-          text-decoration: underline;
+
+def build_search_index() -> None:
+    global search_index
+    search_index = SearchIndex(dataset)
+    logging.info(f"Indexed {len(dataset)} issues for search")
+
+
+# Paging through results doesn't run the query again
+@functools.lru_cache(maxsize=256)
+def find_issues(query: str) -> Tuple[Tuple[int, ...], int]:
+    # Matches best first, and as a bitset for combining with facets
+    if search_index is None:
+        # lru_cache doesn't keep exceptions, so the query runs again later
+        raise ServiceUnavailable("The search index is still being built", retry_after=5)
+    matches = search_index.search(query)
+    return tuple(matches), to_bitset(matches, len(dataset))
+
+
+@app.route("/search")
+def search():
+    """
+    Issues matching any word of ?q=, ranked by relevance unless another
+    ?sort= is given.
+    """
+    query = request.args.get("q", default="", type=str)
+    sort, page, per_page = get_page("relevance")
+    filters = get_filters()
+    matches, mask = find_issues(query)
+    filter_bits = filter_mask(filters)
+    if filter_bits is not None:
+        mask &= filter_bits
+        bits = bit_string(mask, len(dataset))
+        matches = [index for index in matches if bits[index] == "1"]
+    # Cards link to the issue's position in the chosen sort order, or in the
+    # default order when sorting by relevance
+    card_sort = "created_at" if sort == "relevance" else sort
+    rank = dataset.rank(card_sort)
+    if sort != "relevance":
+        matches = sorted(matches, key=rank.__getitem__)
+    active, links = listing_facets("/search", query, filters, mask)
+    offset = (page - 1) * per_page
+    return list_template.render(
+        cards=[
+            render_card(card_sort, rank[index] + 1)
+            for index in matches[offset : offset + per_page]
+        ],
+        css_hash=STYLESHEET_HASHES["list"],
+        base=page_base("/search", query, filters),
+        active=active,
+        facet_links=links,
+        q=query,
+        sort=sort,
+        page=page,
+        per_page=per_page,
+        num_pages=-(-len(matches) // per_page),
+    )
+
+
+@app.route("/issues.json")
+def list_issues():
+    """
+    One page of the listing as JSON, without issue bodies. `number` is the
+    issue's position in this sort order, as used by the /<number> pages.
+    Accepts the same filters as the listing and includes the counts of the
+    most common repositories and labels, like the listing shows.
+    """
+    sort, page, per_page = get_page()
+    filters = get_filters()
+    order = filtered_order(sort, filters)
+    rank = dataset.rank(sort)
+    mask = filter_mask(filters)
+    repo_counts, label_counts = facet_counts(facets.all if mask is None else mask)
+    offset = (page - 1) * per_page
+    return jsonify(
+        {
+            "sort": sort,
+            "page": page,
+            "per_page": per_page,
+            "total": len(order),
+            "facets": {"repo": repo_counts, "label": label_counts},
+            "issues": [
+                dict(
+                    {k: v for k, v in dataset.row(index).items() if k != "Issue Body"},
+                    number=rank[index] + 1,
+                )
+                for index in order[offset : offset + per_page]
+            ],
         }
+    )
 
-        pre { line-height: 125%; padding: 16px; }
-        td.linenos .normal { color: inherit; background-color: transparent; padding-left: 5px; padding-right: 5px; }
-        span.linenos { color: inherit; background-color: transparent; padding-left: 5px; padding-right: 5px; }
-        td.linenos .special { color: #000000; background-color: #ffffc0; padding-left: 5px; padding-right: 5px; }
-        span.linenos.special { color: #000000; background-color: #ffffc0; padding-left: 5px; padding-right: 5px; }
-        .highlight .hll { background-color: #ffffcc }
-        .highlight { background: #f8f8f8; }
-        .highlight .c { color: #3D7B7B; font-style: italic } /* Comment */
-        .highlight .err { border: 1px solid #FF0000 } /* Error */
-        .highlight .k { color: #008000; font-weight: bold } /* Keyword */
-        .highlight .o { color: #666666 } /* Operator */
-        .highlight .ch { color: #3D7B7B; font-style: italic } /* Comment.Hashbang */
-        .highlight .cm { color: #3D7B7B; font-style: italic } /* Comment.Multiline */
-        .highlight .cp { color: #9C6500 } /* Comment.Preproc */
-        .highlight .cpf { color: #3D7B7B; font-style: italic } /* Comment.PreprocFile */
-        .highlight .c1 { color: #3D7B7B; font-style: italic } /* Comment.Single */
-        .highlight .cs { color: #3D7B7B; font-style: italic } /* Comment.Special */
-        .highlight .gd { color: #A00000 } /* Generic.Deleted */
-        .highlight .ge { font-style: italic } /* Generic.Emph */
-        .highlight .gr { color: #E40000 } /* Generic.Error */
-        .highlight .gh { color: #000080; font-weight: bold } /* Generic.Heading */
-        .highlight .gi { color: #008400 } /* Generic.Inserted */
-        .highlight .go { color: #717171 } /* Generic.Output */
-        .highlight .gp { color: #000080; font-weight: bold } /* Generic.Prompt */
-        .highlight .gs { font-weight: bold } /* Generic.Strong */
-        .highlight .gu { color: #800080; font-weight: bold } /* Generic.Subheading */
-        .highlight .gt { color: #0044DD } /* Generic.Traceback */
-        .highlight .kc { color: #008000; font-weight: bold } /* Keyword.Constant */
-        .highlight .kd { color: #008000; font-weight: bold } /* Keyword.Declaration */
-        .highlight .kn { color: #008000; font-weight: bold } /* Keyword.Namespace */
-        .highlight .kp { color: #008000 } /* Keyword.Pseudo */
-        .highlight .kr { color: #008000; font-weight: bold } /* Keyword.Reserved */
-        .highlight .kt { color: #B00040 } /* Keyword.Type */
-        .highlight .m { color: #666666 } /* Literal.Number */
-        .highlight .s { color: #BA2121 } /* Literal.String */
-        .highlight .na { color: #687822 } /* Name.Attribute */
-        .highlight .nb { color: #008000 } /* Name.Builtin */
-        .highlight .nc { color: #0000FF; font-weight: bold } /* Name.Class */
-        .highlight .no { color: #880000 } /* Name.Constant */
-        .highlight .nd { color: #AA22FF } /* Name.Decorator */
-        .highlight .ni { color: #717171; font-weight: bold } /* Name.Entity */
-        .highlight .ne { color: #CB3F38; font-weight: bold } /* Name.Exception */
-        .highlight .nf { color: #0000FF } /* Name.Function */
-        .highlight .nl { color: #767600 } /* Name.Label */
-        .highlight .nn { color: #0000FF; font-weight: bold } /* Name.Namespace */
-        .highlight .nt { color: #008000; font-weight: bold } /* Name.Tag */
-        .highlight .nv { color: #19177C } /* Name.Variable */
-        .highlight .ow { color: #AA22FF; font-weight: bold } /* Operator.Word */
-        .highlight .w { color: #bbbbbb } /* Text.Whitespace */
-        .highlight .mb { color: #666666 } /* Literal.Number.Bin */
-        .highlight .mf { color: #666666 } /* Literal.Number.Float */
-        .highlight .mh { color: #666666 } /* Literal.Number.Hex */
-        .highlight .mi { color: #666666 } /* Literal.Number.Integer */
-        .highlight .mo { color: #666666 } /* Literal.Number.Oct */
-        .highlight .sa { color: #BA2121 } /* Literal.String.Affix */
-        .highlight .sb { color: #BA2121 } /* Literal.String.Backtick */
-        .highlight .sc { color: #BA2121 } /* Literal.String.Char */
-        .highlight .dl { color: #BA2121 } /* Literal.String.Delimiter */
-        .highlight .sd { color: #BA2121; font-style: italic } /* Literal.String.Doc */
-        .highlight .s2 { color: #BA2121 } /* Literal.String.Double */
-        .highlight .se { color: #AA5D1F; font-weight: bold } /* Literal.String.Escape */
-        .highlight .sh { color: #BA2121 } /* Literal.String.Heredoc */
-        .highlight .si { color: #A45A77; font-weight: bold } /* Literal.String.Interpol */
-        .highlight .sx { color: #008000 } /* Literal.String.Other */
-        .highlight .sr { color: #A45A77 } /* Literal.String.Regex */
-        .highlight .s1 { color: #BA2121 } /* Literal.String.Single */
-        .highlight .ss { color: #19177C } /* Literal.String.Symbol */
-        .highlight .bp { color: #008000 } /* Name.Builtin.Pseudo */
-        .highlight .fm { color: #0000FF } /* Name.Function.Magic */
-        .highlight .vc { color: #19177C } /* Name.Variable.Class */
-        .highlight .vg { color: #19177C } /* Name.Variable.Global */
-        .highlight .vi { color: #19177C } /* Name.Variable.Instance */
-        .highlight .vm { color: #19177C } /* Name.Variable.Magic */
-        .highlight .il { color: #666666 } /* Literal.Number.Integer.Long */
-
-      </style>
-    </head>
-    <body>
-      <div class="navbar">
-        <a href="/">Home</a>
-        <a href="/1?sort={{ sort }}">First</a>
-        <a href="/{{ prev_issue_num }}?sort={{ sort }}">Previous</a>
-        <a href="/{{ random_issue_num }}?sort={{ sort }}">Random</a>
-        <a href="/{{ next_issue_num }}?sort={{ sort }}">Next</a>
-        <a href="/{{ num_issues }}?sort={{ sort }}">Last</a>
-      </div>
-      <div class="container">
-        <h1><a href="{{ issue['Issue URL'] }}" target="_blank" rel="noopener noreferrer">{{ issue['Issue Title'] }}</a></h1>
-        <div class="metadata">
-          <p>
-            <a href="{{ issue['Issue URL'] }}" target="_blank" rel="noopener noreferrer">
-              <strong>Comments:</strong> {{ issue['Comments'] }}
-            </a>
-          </p>
-          <p><strong>Repository:</strong> {{ issue['Repository'] }}</p>
-          <p><strong>Created at:</strong> {{ issue['Created At'] }}</p>
-          <p><strong>Updated at:</strong> {{ issue['Updated At'] }}</p>
-          <p><strong>Total reactions:</strong> {{ issue['Total Reactions'] }}</p>
-        </div>
-        {% if issue['Labels'] %}
-          <div class="labels">
-            {% for label in issue['Labels'].split(', ') %}
-              <span class="label">{{ label }}</span>
-            {% endfor %}
-          </div>
-        {% endif %}
-        <div class="issue-body">{{ issue_body_html }}</div>
-      </div>
-    </body>
-    </html>
-    """,
-        issue=issue,
+
+@app.route("/<int:issue_num>")
+def get_issue(issue_num):
+    sort = request.args.get("sort", default="created_at", type=str)
+    try:
+        issue = get_issue_at(sort, issue_num)
+    except IndexError:
+        raise NotFound("Issue not found")
+
+    # Convert Markdown to HTML
+    issue_body_html = Markup(render_cache.render(issue))
+
+    # Render issue details
+    return issue_template.render(
+        header=render_issue_header(sort, issue_num),
+        css_hash=STYLESHEET_HASHES["issue"],
         issue_num=issue_num,
         issue_body_html=issue_body_html,
-        num_issues=len(SORTED_ISSUES[sort]),
+        num_issues=len(dataset),
         sort=sort,
         prev_issue_num=max(1, issue_num - 1),
-        random_issue_num=random.randint(1, len(SORTED_ISSUES[sort])),
-        next_issue_num=min(issue_num + 1, len(SORTED_ISSUES[sort])),
+        random_issue_num=random.randint(1, len(dataset)),
+        next_issue_num=min(issue_num + 1, len(dataset)),
     )
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if args.render_cache:
+        render_cache.load(args.render_cache, dataset.rows("created_at"))
+        atexit.register(render_cache.save, args.render_cache)
+    # Issues are rendered in the background in the default sort order, so
+    # most pages are already rendered when first opened
+    threading.Thread(
+        target=render_cache.prerender, args=(dataset.rows("created_at"),), daemon=True
+    ).start()
+    # Listings are served right away; /search answers 503 until this is done
+    threading.Thread(target=build_search_index, daemon=True).start()
     app.run(port=args.port)
@@ -4,54 +4,129 @@ Makes repositories starred on `API_TOKEN` get watched on `BURNER_API_TOKEN`.
 Author: GPT-4
 
 Usage:
-  python watch_on_burner.py
+  python watch_on_burner.py [--concurrency <n>] [--unwatch] [--state <file>]
 """
 
 __author__ = "GPT-4"
 
+import argparse
+import json
 import os
-import requests
-from typing import List, Optional
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Set, Tuple
+from github_client import API_URL, GitHubClient
 
-# Load environment variables from .env file
-load_dotenv()
 API_TOKEN = os.getenv("API_TOKEN")
 BURNER_API_TOKEN = os.getenv("BURNER_API_TOKEN")
 
-headers = {"Authorization": f"token {API_TOKEN}"}
-burner_headers = {"Authorization": f"token {BURNER_API_TOKEN}"}
-
-def get_next_page_link(link_header: str) -> Optional[str]:
-    if link_header:
-        links = link_header.split(", ")
-        for link in links:
-            url, rel = link.split("; ")
-            if rel == 'rel="next"':
-                return url.strip("<>")
-    return None
-
-def get_starred_repos() -> List[str]:
-    url = "https://api.github.com/user/starred?per_page=100"
-    all_repos = []
-    while url:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        all_repos.extend([repo["full_name"] for repo in response.json()])
-        url = get_next_page_link(response.headers.get("Link", ""))
-    return all_repos
+client = GitHubClient([API_TOKEN])
+burner_client = GitHubClient([BURNER_API_TOKEN])
+
+# Repos this script watched, so --unwatch leaves the burner's other watches alone
+DEFAULT_STATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "burner_watches.json")
+
+def load_watched_by_us(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf8") as f:
+        return set(json.load(f))
+
+def save_watched_by_us(path: str, repos: Set[str]) -> None:
+    with open(f"{path}.tmp", "w", encoding="utf8") as f:
+        json.dump(sorted(repos), f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def get_watched_repos() -> Dict[str, str]:
+    # Keyed by lowercase name, since GitHub names are case-insensitive
+    return {
+        repo["full_name"].lower(): repo["full_name"]
+        for repo in burner_client.paginate(
+            f"{API_URL}/user/subscriptions",
+            {"per_page": 100},
+            burner_client.user_headers,
+        )
+    }
 
 def watch_repo_on_burner(repo_name: str) -> None:
-    url = f"https://api.github.com/repos/{repo_name}/subscription"
+    url = f"{API_URL}/repos/{repo_name}/subscription"
     data = {
         "subscribed": True
     }
-    response = requests.put(url, headers=burner_headers, json=data)
+    response = burner_client.request(
+        "PUT", url, headers=burner_client.user_headers, json=data
+    )
     response.raise_for_status()
 
+def unwatch_repo_on_burner(repo_name: str) -> None:
+    url = f"{API_URL}/repos/{repo_name}/subscription"
+    response = burner_client.request(
+        "DELETE", url, headers=burner_client.user_headers
+    )
+    response.raise_for_status()
+
+def apply(action: Callable[[str], None], verb: str, repos: List[str], concurrency: int) -> List[str]:
+    """
+    Returns the repos `action` succeeded for.
+    """
+    def run(repo: str) -> Tuple[bool, str]:
+        # One failing repo shouldn't stop the rest
+        try:
+            action(repo)
+            return True, f"{verb} {repo} on burner account..."
+        except Exception as e:
+            return False, f"Failed {verb.lower()} {repo}: {str(e)}"
+
+    done = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        # Printed from here, in order, so lines from workers don't interleave
+        for repo, (ok, message) in zip(repos, executor.map(run, repos)):
+            print(message)
+            if ok:
+                done.append(repo)
+    return done
+
 if __name__ == "__main__":
-    starred_repos = get_starred_repos()
-    for repo in starred_repos:
-        print(f"Watching {repo} on burner account...")
-        watch_repo_on_burner(repo)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Number of watch/unwatch requests to send at the same time",
+    )
+    parser.add_argument(
+        "--unwatch",
+        action="store_true",
+        help="Also unwatch repos this script watched that are no longer starred",
+    )
+    parser.add_argument(
+        "--state",
+        type=str,
+        default=DEFAULT_STATE,
+        help="File recording the repos this script watched",
+    )
+    args = parser.parse_args()
+
+    # Only the difference between stars and current watches needs writes
+    starred_repos = [repo.full_name for repo in client.get_starred_repos()]
+    watched_repos = get_watched_repos()
+    to_watch = [repo for repo in starred_repos if repo.lower() not in watched_repos]
+    print(
+        f"{len(starred_repos) - len(to_watch)} of {len(starred_repos)} "
+        "starred repos are already watched"
+    )
+    # Lowercase names; repos unwatched by hand since are forgotten
+    watched_by_us = load_watched_by_us(args.state) & watched_repos.keys()
+    watched = apply(watch_repo_on_burner, "Watching", to_watch, args.concurrency)
+    watched_by_us |= {repo.lower() for repo in watched}
+
+    if args.unwatch:
+        starred = {repo.lower() for repo in starred_repos}
+        to_unwatch = sorted(
+            name
+            for key, name in watched_repos.items()
+            if key in watched_by_us and key not in starred
+        )
+        unwatched = apply(unwatch_repo_on_burner, "Unwatching", to_unwatch, args.concurrency)
+        watched_by_us -= {repo.lower() for repo in unwatched}
+    save_watched_by_us(args.state, watched_by_us)
     print("Done!")